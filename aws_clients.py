@@ -0,0 +1,80 @@
+"""One place to build the boto3 sessions, resources and clients the bots use.
+
+Every client gets the same botocore Config, tunable from creds:
+
+    AWS_MAX_POOL_CONNECTIONS  HTTP connections kept per client (50)
+    AWS_RETRY_MODE            "adaptive" (client-side rate limiting) or "standard"
+    AWS_MAX_ATTEMPTS          attempts per call, including the first (5)
+    AWS_CONNECT_TIMEOUT       seconds (3)
+    AWS_READ_TIMEOUT          seconds (10)
+    AWS_TCP_KEEPALIVE         keep idle pooled connections alive (True)
+"""
+import threading
+
+import boto3
+from botocore.config import Config
+
+import creds
+
+CLIENT_CONFIG = Config(
+    max_pool_connections=getattr(creds, "AWS_MAX_POOL_CONNECTIONS", 50),
+    retries={
+        "mode": getattr(creds, "AWS_RETRY_MODE", "adaptive"),
+        "max_attempts": getattr(creds, "AWS_MAX_ATTEMPTS", 5),
+    },
+    connect_timeout=getattr(creds, "AWS_CONNECT_TIMEOUT", 3),
+    read_timeout=getattr(creds, "AWS_READ_TIMEOUT", 10),
+    tcp_keepalive=getattr(creds, "AWS_TCP_KEEPALIVE", True),
+)
+
+_lock = threading.Lock()
+_dynamodb = None
+_s3 = None
+_tables = {}
+
+
+def new_session():
+    return boto3.session.Session(
+        aws_access_key_id=creds.AWS_ACCESS_KEY,
+        aws_secret_access_key=creds.AWS_SECRET_KEY,
+        region_name=creds.REGION_NAME
+    )
+
+
+def dynamodb_resource(session=None):
+    """A new DynamoDB resource, or the shared one when no session is given.
+
+    boto3 resources are not thread-safe: share the default one only from a
+    single thread (the event loop) and give every other thread its own
+    session.
+    """
+    global _dynamodb
+    if session is not None:
+        return session.resource('dynamodb', config=CLIENT_CONFIG)
+    with _lock:
+        if _dynamodb is None:
+            _dynamodb = new_session().resource('dynamodb', config=CLIENT_CONFIG)
+        return _dynamodb
+
+
+def s3_client(session=None):
+    """A new S3 client, or the shared one (clients are thread-safe)."""
+    global _s3
+    if session is not None:
+        return session.client('s3', config=CLIENT_CONFIG)
+    with _lock:
+        if _s3 is None:
+            _s3 = new_session().client('s3', config=CLIENT_CONFIG)
+        return _s3
+
+
+def table(name):
+    """Cached Table handle on the shared DynamoDB resource."""
+    handle = _tables.get(name)
+    if handle is None:
+        resource = dynamodb_resource()
+        with _lock:
+            handle = _tables.get(name)
+            if handle is None:
+                handle = _tables[name] = resource.Table(name)
+    return handle
@@ -0,0 +1,70 @@
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_clients
+
+logger = logging.getLogger(__name__)
+
+
+class AWSExecutor:
+    """Runs blocking boto3 calls on a thread pool so handlers can await them.
+
+    boto3 resources are not thread-safe, so every worker thread gets its own
+    session, DynamoDB resource and Table handles. The S3 client is
+    thread-safe and shared. All of them use the tuned config from
+    aws_clients; keep its AWS_MAX_POOL_CONNECTIONS at least ``max_workers``.
+    """
+
+    def __init__(self, session_factory=aws_clients.new_session, max_workers=16):
+        self.session_factory = session_factory
+        self.max_workers = max_workers
+        self._local = threading.local()
+        self._pool = None
+        self._closed = False
+
+    def _ensure_started(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="aws-io",
+            )
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self.session_factory()
+        return session
+
+    def dynamodb(self):
+        resource = getattr(self._local, "dynamodb", None)
+        if resource is None:
+            resource = self._local.dynamodb = aws_clients.dynamodb_resource(self._session())
+            self._local.tables = {}
+        return resource
+
+    def table(self, name):
+        resource = self.dynamodb()
+        table = self._local.tables.get(name)
+        if table is None:
+            table = self._local.tables[name] = resource.Table(name)
+        return table
+
+    def s3(self):
+        return aws_clients.s3_client()
+
+    async def run(self, fn, *args, **kwargs):
+        if self._closed:
+            raise RuntimeError("AWS executor is shut down")
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self, wait=True):
+        self._closed = True
+        if self._pool is not None:
+            logger.info("Shutting down AWS executor")
+            self._pool.shutdown(wait=wait)
+            self._pool = None
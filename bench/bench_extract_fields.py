@@ -0,0 +1,165 @@
+"""Micro-benchmark: receipt_fields.extract_fields against the regex cascade
+it replaced.
+
+    python bench/bench_extract_fields.py [--repeat N]
+
+Both extractors run over the same OCR samples; the script fails if their
+results differ and otherwise prints per-call timings and the speedup.
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from receipt_fields import extract_fields  # noqa: E402
+
+# Tesseract output captured from KBZPay history screenshots (account
+# numbers and ids changed), plus the noisy variants seen in the OCR failure
+# channel.
+SAMPLES = [
+    # English locale
+    "Payment Successful\n\n-5,000.00 Ks\n\nTransaction Time 12/05/2024 10:11:12\n"
+    "Transaction No. 01003984021234567890\nTransaction Type Transfer\n"
+    "Transfer To U MIN KO NAING (******3307)\nAmount -5,000.00 Ks\nNotes Shopping, payment\n",
+    "Details\nTransaction Time 03/11/2024 21:04:55\nTransaction No 01004123987650012345\n"
+    "Transaction Type Transfer\nTransfer To U MIN KO NAING (*******3307)\n"
+    "Amount -7,000.00 Ks\nNotes payment\n",
+    # footer left in, lower-quality OCR
+    "-5,000.00 Ks\nTransaction Time  01/02/2025 08:00:01\nTransaction No. 010039840212345678\n"
+    "Transaction Type  Transfer\nTransfer To  U MIN KO NAING  <##3307>\nAmount  -5,000.00 Ks\n"
+    "Notes\n\nThank you for using KBZPay!\n",
+    # Notes missing, amount last
+    "Transaction Time 15/06/2024 13:45:10\nTransaction No 01003984029876543210\n"
+    "Transfer To U MIN KO NAING (****3307)\nAmount -12,500.00 Ks\n",
+    # Myanmar locale (labels read by the mya model)
+    "ငွေပေးချေမှု အောင်မြင်ပါသည်\n-5,000.00 Ks\nလုပ်ဆောင်ချိန် 12/05/2024 10:11:12\n"
+    "လုပ်ဆောင်မှုအမှတ် 01003984021234567890\nလွှဲပို့သည့်အကောင့် U MIN KO NAING (******3307)\n"
+    "ငွေပမာဏ -5,000.00 Ks payment\n",
+    "12/05/2024 10:11:12 01003984021234567890 U MIN KO NAING ******3307 5,000 Ks",
+    # Not a receipt
+    "Hello world\nThis is not a payment screenshot",
+    "",
+]
+
+
+# -------------------- Previous implementation --------------------
+def legacy_extract_fields(text):
+    result = {
+        "time": None,
+        "transaction_id": None,
+        "amount": None,
+        "name": None,
+        "notes": None
+    }
+
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    # English format
+    eng_time = re.search(r'Transaction Time\s*([\d/]+ [\d:]+)', text)
+    eng_id = re.search(r'Transaction No\.?\s*(\d{16,20})', text)
+    eng_amount = re.search(r'Amount\s*(-?\d[\d,]*\.?\d*)\s*Ks', text)
+
+    if eng_time or eng_id or eng_amount:
+        if eng_time:
+            result["time"] = eng_time.group(1)
+        if eng_id:
+            result["transaction_id"] = eng_id.group(1)
+        if eng_amount:
+            amount = eng_amount.group(1).replace(',', '')
+            result["amount"] = f"{amount} Ks"
+
+        name_match = re.search(r'Transfer To\s*([A-Z][A-Za-z\s]+)\s*[\(<]?[*#]+(\d{4})[\)>]?', text)
+        if not name_match:
+            name_match = re.search(r'Transfer To\s*([A-Z][A-Za-z\s]+)\s*[*#]+\d{4}', text)
+        if name_match:
+            result["name"] = f"{name_match.group(1).strip()} ({name_match.group(2) if len(name_match.groups()) > 1 else name_match.group(1).split()[-1]})"
+
+        notes_match = re.search(r'Notes\s*([^\n]+?)(?=\s*(?:Transaction|Transfer|Amount|$))', text)
+        if notes_match:
+            result["notes"] = notes_match.group(1).strip()
+        else:
+            amount_pos = text.find('Amount') if 'Amount' in text else -1
+            if amount_pos > -1:
+                notes_part = text[amount_pos:].split('Ks')[-1].strip()
+                if notes_part and not any(x in notes_part for x in ['Transaction', 'Transfer']):
+                    result["notes"] = notes_part.split('\n')[0].strip()
+
+        return result
+
+    # Myanmar fallback
+    my_time = re.search(r'(\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2})', text)
+    my_id = re.search(r'(\d{16,20})', text)
+    my_amount = re.search(r'(-?\d[\d,]*\.?\d*)\s*Ks', text)
+
+    if my_time or my_id or my_amount:
+        if my_time:
+            result["time"] = my_time.group(1)
+        if my_id:
+            result["transaction_id"] = my_id.group(1)
+        if my_amount:
+            amount = my_amount.group(1).replace(',', '')
+            result["amount"] = f"{amount} Ks"
+
+        name_match = re.search(r'([A-Z][A-Za-z\s]+)\s*[\(<]?[*#]+(\d{4})[\)>]?', text)
+        if not name_match:
+            name_match = re.search(r'([A-Z][A-Za-z\s]+)\s*[*#]+\d{4}', text)
+        if name_match:
+            result["name"] = f"{name_match.group(1).strip()} ({name_match.group(2) if len(name_match.groups()) > 1 else name_match.group(1).split()[-1]})"
+
+        amount_pos = text.find('Ks') if 'Ks' in text else -1
+        if amount_pos > -1:
+            notes_part = text[amount_pos+2:].strip()
+            if notes_part and not any(x in notes_part for x in ['Transaction', 'Transfer']):
+                result["notes"] = notes_part.split('\n')[0].strip()
+
+        return result
+
+    # Fallback
+    time_match = re.search(r'(\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2})', text)
+    id_match = re.search(r'(\d{16,20})', text)
+    amount_match = re.search(r'(-?\d[\d,]*\.?\d*)\s*Ks', text)
+
+    if time_match:
+        result["time"] = time_match.group(1)
+    if id_match:
+        result["transaction_id"] = id_match.group(1)
+    if amount_match:
+        amount = amount_match.group(1).replace(',', '')
+        result["amount"] = f"{amount} Ks"
+
+    name_match = re.search(r'([A-Z][A-Za-z\s]+)\s*[\(<]?[*#]+(\d{4})[\)>]?', text)
+    if not name_match:
+        name_match = re.search(r'([A-Z][A-Za-z\s]+)\s*[*#]+\d{4}', text)
+    if name_match:
+        result["name"] = f"{name_match.group(1).strip()} ({name_match.group(2) if len(name_match.groups()) > 1 else name_match.group(1).split()[-1]})"
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    for sample in SAMPLES:
+        expected, actual = legacy_extract_fields(sample), extract_fields(sample)
+        if expected != actual:
+            sys.exit(f"Mismatch on {sample!r}:\n  legacy: {expected}\n  new:    {actual}")
+
+    def run(fn):
+        # Best of five keeps scheduler noise out of the comparison.
+        return min(timeit.repeat(lambda: [fn(s) for s in SAMPLES], number=args.repeat, repeat=5))
+
+    legacy = run(legacy_extract_fields)
+    new = run(extract_fields)
+    calls = args.repeat * len(SAMPLES)
+    print(f"legacy extract_fields: {legacy / calls * 1e6:8.2f} us/call")
+    print(f"receipt_fields:        {new / calls * 1e6:8.2f} us/call")
+    print(f"speedup:               {legacy / new:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Render synthetic KBZPay history receipts with ground truth for run_bench.py.
+
+    python bench/generate_receipts.py OUT_DIR [--count 200] [--seed 1]
+        [--font FONT.ttf] [--mya-font NotoSansMyanmar-Regular.ttf]
+
+Every receipt is written as <id>.jpg next to <id>.json holding the fields
+extract_fields should return for it plus the distortions applied. Burmese
+receipts need a font with Myanmar glyphs (--mya-font); without one only
+English receipts are generated.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from receipt_locale import MYANMAR_LABELS  # noqa: E402
+
+WIDTH, HEIGHT = 1080, 2160
+BACKGROUND = (242, 243, 247)
+HEADER = (0, 91, 170)
+TEXT = (33, 33, 33)
+MUTED = (120, 120, 120)
+
+ENGLISH_LABELS = {
+    "title": "Transaction Details",
+    "success": "Payment Successful",
+    "time": "Transaction Time",
+    "no": "Transaction No.",
+    "type": "Transaction Type",
+    "to": "Transfer To",
+    "amount": "Amount",
+    "notes": "Notes",
+    "ks": "Ks",
+}
+# First Burmese spelling of each label in the normalization table.
+_BURMESE = {}
+for burmese, english in MYANMAR_LABELS:
+    _BURMESE.setdefault(english, burmese)
+MYANMAR_LABELS_BY_KEY = {
+    "title": "ငွေလွှဲ အသေးစိတ်",
+    "success": "ငွေပေးချေမှု အောင်မြင်ပါသည်",
+    "time": _BURMESE["Transaction Time"],
+    "no": _BURMESE["Transaction No"],
+    "type": _BURMESE["Transaction Type"],
+    "to": _BURMESE["Transfer To"],
+    "amount": _BURMESE["Amount"],
+    "notes": _BURMESE["Notes"],
+    "ks": _BURMESE["Ks"],
+}
+MYANMAR_DIGITS = str.maketrans("0123456789", "၀၁၂၃၄၅၆၇၈၉")
+
+FOOTER = (
+    "Thank you for using KBZPay! The e-receipt only means you already paid for the\n"
+    "merchant. You need to confirm the final transaction status with merchant."
+)
+NAMES = ["U MIN KO NAING", "DAW AYE AYE MON", "U KYAW ZIN HTET", "DAW THIDA WIN"]
+NOTES = ["Shopping, payment", "payment", "course fee", "Merxy Lab", "ဈေးဝယ်"]
+
+# Distortion levels sampled per receipt.
+NOISE_LEVELS = [0, 8, 16, 32]
+BLUR_LEVELS = [0, 0.6, 1.2, 2.0]
+JPEG_QUALITIES = [95, 80, 60, 40]
+SCALES = [1.0, 0.75, 0.6]
+
+
+def _font(path, size):
+    if path:
+        return ImageFont.truetype(path, size)
+    return ImageFont.load_default(size=size)
+
+
+def random_receipt(rng, locale, burmese_notes=True):
+    when = datetime(2024, 1, 1) + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+    amount = rng.choice([5000, 5000, 7000, 10000, 12500, 3000, 150000])
+    fields = {
+        "time": when.strftime("%d/%m/%Y %H:%M:%S"),
+        "transaction_id": "0100" + "".join(rng.choice("0123456789") for _ in range(16)),
+        "amount": f"-{amount}.00 Ks",
+        "name": None,
+        "notes": rng.choice(NOTES if burmese_notes else [n for n in NOTES if n.isascii()]),
+    }
+    name = rng.choice(NAMES)
+    last4 = "3307" if name == "U MIN KO NAING" else f"{rng.randrange(10000):04d}"
+    fields["name"] = f"{name} ({last4})"
+    return fields, {
+        "amount_text": f"-{amount:,}.00",
+        "name": name,
+        "masked": f"(******{last4})",
+        "locale": locale,
+    }
+
+
+def render(fields, extra, fonts):
+    labels = MYANMAR_LABELS_BY_KEY if extra["locale"] == "mya" else ENGLISH_LABELS
+    label_font = fonts["mya"] if extra["locale"] == "mya" else fonts["body"]
+    time_text = fields["time"]
+    if extra["locale"] == "mya":
+        time_text = time_text.translate(MYANMAR_DIGITS)
+
+    image = Image.new("RGB", (WIDTH, HEIGHT), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, WIDTH, 90), fill=(20, 20, 20))
+    draw.rectangle((0, 90, WIDTH, 250), fill=HEADER)
+    draw.text((WIDTH // 2, 170), labels["title"], fill="white", font=label_font, anchor="mm")
+
+    draw.rounded_rectangle((40, 300, WIDTH - 40, 1650), radius=30, fill="white")
+    draw.text((WIDTH // 2, 420), labels["success"], fill=MUTED, font=label_font, anchor="mm")
+    draw.text(
+        (WIDTH // 2, 520), f"{extra['amount_text']} {labels['ks']}",
+        fill=TEXT, font=fonts["big"], anchor="mm",
+    )
+
+    rows = [
+        (labels["time"], [time_text]),
+        (labels["no"], [fields["transaction_id"]]),
+        (labels["type"], ["Transfer"]),
+        (labels["to"], [extra["name"], extra["masked"]]),
+        (labels["amount"], [f"{extra['amount_text']} {labels['ks']}"]),
+        (labels["notes"], [fields["notes"]]),
+    ]
+    y = 680
+    for label, values in rows:
+        draw.text((90, y), label, fill=MUTED, font=label_font)
+        for value in values:
+            font = fonts["mya"] if any("က" <= ch <= "႟" for ch in value) else fonts["body"]
+            draw.text((WIDTH - 90, y), value, fill=TEXT, font=font, anchor="ra")
+            y += 60
+        y += 70
+    draw.multiline_text((WIDTH // 2, 1800), FOOTER, fill=MUTED, font=fonts["small"], anchor="ma", align="center")
+    return image
+
+
+def distort(image, rng):
+    params = {
+        "noise": rng.choice(NOISE_LEVELS),
+        "blur": rng.choice(BLUR_LEVELS),
+        "quality": rng.choice(JPEG_QUALITIES),
+        "scale": rng.choice(SCALES),
+    }
+    if params["scale"] != 1.0:
+        image = image.resize(
+            (round(image.width * params["scale"]), round(image.height * params["scale"])),
+            Image.LANCZOS,
+        )
+    if params["noise"]:
+        noise = Image.effect_noise(image.size, params["noise"]).convert("RGB")
+        image = Image.blend(image, noise, 0.15)
+    if params["blur"]:
+        image = image.filter(ImageFilter.GaussianBlur(params["blur"]))
+    return image, params
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out_dir")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--font", help="TrueType font for Latin text (default: Pillow's bundled font)")
+    parser.add_argument("--mya-font", help="TrueType font with Myanmar glyphs")
+    args = parser.parse_args()
+
+    fonts = {
+        "body": _font(args.font, 40),
+        "big": _font(args.font, 72),
+        "small": _font(args.font, 26),
+        "mya": _font(args.mya_font, 40) if args.mya_font else None,
+    }
+    locales = ["eng", "mya"] if fonts["mya"] else ["eng"]
+    if not fonts["mya"]:
+        print("No --mya-font given; generating English receipts only", file=sys.stderr)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    rng = random.Random(args.seed)
+    for index in range(args.count):
+        locale = locales[index % len(locales)]
+        fields, extra = random_receipt(rng, locale, burmese_notes=bool(fonts["mya"]))
+        image, params = distort(render(fields, extra, fonts), rng)
+        receipt_id = f"{index:05d}_{locale}"
+        image.save(os.path.join(args.out_dir, f"{receipt_id}.jpg"), quality=params["quality"])
+        with open(os.path.join(args.out_dir, f"{receipt_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {"image": f"{receipt_id}.jpg", "locale": locale, "distortion": params, "fields": fields},
+                f, ensure_ascii=False, indent=2,
+            )
+    print(f"Wrote {args.count} receipts to {args.out_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""Offline latency / throughput / accuracy benchmark for the OCR pipeline.
+
+    python bench/generate_receipts.py corpus/
+    python bench/run_bench.py corpus/ [--workers 4] [--limit N]
+        [--preprocess | --no-preprocess] [--no-layout] [--lang eng+mya]
+        [--output results.json]
+
+For every receipt in the corpus it times each pipeline stage
+(extract_text_from_image, read_receipt, extract_fields,
+extract_payment_info, clean_kbz_ocr_text) and compares the fields
+read_receipt returns with the ground truth next to the image. A second run
+spreads the corpus over --workers OCR processes to measure throughput per
+core. Results are printed as JSON (and written to --output), so runs of two
+bot versions can be diffed.
+
+Nothing talks to Telegram or AWS; the bot module is only imported for its
+OCR functions, so creds.py and the bot's dependencies must be importable.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import merxy_lab_bot as bot  # noqa: E402
+
+FIELDS = ["time", "transaction_id", "amount", "name", "notes"]
+
+
+def load_corpus(corpus_dir, limit=None):
+    receipts = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(corpus_dir, name), encoding="utf-8") as f:
+            truth = json.load(f)
+        with open(os.path.join(corpus_dir, truth["image"]), "rb") as f:
+            truth["bytes"] = f.read()
+        receipts.append(truth)
+        if limit and len(receipts) >= limit:
+            break
+    return receipts
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "n": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def run_stages(receipts):
+    timings = {stage: [] for stage in (
+        "extract_text_from_image", "read_receipt", "extract_fields",
+        "extract_payment_info", "clean_kbz_ocr_text",
+    )}
+    outputs = []
+    for receipt in receipts:
+        text, elapsed = timed(bot.extract_text_from_image, receipt["bytes"])
+        timings["extract_text_from_image"].append(elapsed)
+        for stage, fn in (
+            ("extract_fields", bot.extract_fields),
+            ("extract_payment_info", bot.extract_payment_info),
+            ("clean_kbz_ocr_text", bot.clean_kbz_ocr_text),
+        ):
+            timings[stage].append(timed(fn, text)[1])
+        result, elapsed = timed(bot.read_receipt, receipt["bytes"])
+        timings["read_receipt"].append(elapsed)
+        outputs.append(result["fields"])
+    return {stage: summarize(samples) for stage, samples in timings.items()}, outputs
+
+
+def accuracy(receipts, outputs):
+    per_field = {field: 0 for field in FIELDS}
+    by_locale = {}
+    failures = []
+    for receipt, fields in zip(receipts, outputs):
+        truth = receipt["fields"]
+        wrong = [field for field in FIELDS if fields.get(field) != truth[field]]
+        for field in FIELDS:
+            per_field[field] += field not in wrong
+        stats = by_locale.setdefault(receipt["locale"], {"receipts": 0, "all_correct": 0})
+        stats["receipts"] += 1
+        stats["all_correct"] += not wrong
+        if wrong:
+            failures.append({
+                "image": receipt["image"],
+                "distortion": receipt["distortion"],
+                "wrong": {field: {"expected": truth[field], "got": fields.get(field)} for field in wrong},
+            })
+    total = len(receipts)
+    return {
+        "fields": {field: round(count / total, 4) for field, count in per_field.items()},
+        "all_fields_correct": round(sum(s["all_correct"] for s in by_locale.values()) / total, 4),
+        "by_locale": {
+            locale: round(s["all_correct"] / s["receipts"], 4) for locale, s in by_locale.items()
+        },
+        "failures": failures,
+    }
+
+
+def throughput(receipts, workers):
+    with ProcessPoolExecutor(max_workers=workers, initializer=bot.init_ocr_worker) as pool:
+        # Let every worker load its models before the clock starts.
+        list(pool.map(bot.read_receipt, [r["bytes"] for r in receipts[:workers]]))
+        started = time.perf_counter()
+        list(pool.map(bot.read_receipt, [r["bytes"] for r in receipts]))
+        elapsed = time.perf_counter() - started
+    per_second = len(receipts) / elapsed
+    return {
+        "workers": workers,
+        "receipts_per_sec": round(per_second, 3),
+        "receipts_per_sec_per_core": round(per_second / workers, 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus_dir")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--preprocess", action=argparse.BooleanOptionalAction, default=None,
+                        help="override OCR_PREPROCESS")
+    parser.add_argument("--no-layout", action="store_true", help="set OCR_LAYOUT = False")
+    parser.add_argument("--lang", help="override OCR_LANG")
+    parser.add_argument("--output", help="also write the JSON results here")
+    args = parser.parse_args()
+
+    # Module globals are read at call time (and inherited by forked workers).
+    if args.preprocess is not None:
+        bot.OCR_PREPROCESS = args.preprocess
+    if args.no_layout:
+        bot.OCR_LAYOUT = False
+    if args.lang:
+        bot.OCR_LANG = args.lang
+
+    receipts = load_corpus(args.corpus_dir, args.limit)
+    if not receipts:
+        sys.exit(f"No receipts in {args.corpus_dir}; run bench/generate_receipts.py first")
+
+    # extract_text_from_image prints the OCR text; keep stdout for the JSON.
+    with contextlib.redirect_stdout(sys.stderr):
+        stages, outputs = run_stages(receipts)
+        throughput_result = throughput(receipts, args.workers)
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "receipts": len(receipts),
+            "ocr_backend": bot.ocr_backends.get_backend(bot.OCR_BACKEND, bot.TESSDATA_PATH).name,
+            "settings": {
+                "OCR_PREPROCESS": bot.OCR_PREPROCESS,
+                "OCR_LAYOUT": bot.OCR_LAYOUT,
+                "OCR_LANG": bot.OCR_LANG,
+            },
+        },
+        "stages": stages,
+        "throughput": throughput_result,
+        "accuracy": accuracy(receipts, outputs),
+    }
+    encoded = json.dumps(results, ensure_ascii=False, indent=2)
+    print(encoded)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(encoded)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import hashlib
+import math
+import threading
+
+
+class BloomFilter:
+    """Set membership with no false negatives and a tunable false-positive rate.
+
+    Sized for ``capacity`` values at ``error_rate``; ``max_bytes`` caps the
+    bit array, trading a higher false-positive rate for memory. Adding more
+    than ``capacity`` values keeps working but raises the rate, see
+    ``estimated_error_rate``.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001, max_bytes=None):
+        num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        if max_bytes:
+            num_bits = min(num_bits, max_bytes * 8)
+        self.num_bits = max(8, num_bits)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self.loaded = False
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._lock = threading.Lock()
+
+    @property
+    def size_bytes(self):
+        return len(self._bits)
+
+    def _positions(self, value):
+        # Double hashing: k positions from one 128-bit digest.
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, value):
+        positions = self._positions(value)
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, value):
+        return all(self._bits[p >> 3] & (1 << (p & 7)) for p in self._positions(value))
+
+    def estimated_error_rate(self):
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
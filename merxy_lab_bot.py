@@ -9,14 +9,37 @@ from telegram.ext import (
 )
 from PIL import Image
 import pytesseract
-import boto3
+import aws_clients
+import webhook_server
 import os
+import io
 import creds
 import re
 from datetime import datetime, timezone
-from boto3.dynamodb.conditions import Key, Attr
 import platform
 import logging
+import time
+import asyncio
+from types import SimpleNamespace
+from aws_io import AWSExecutor
+from bloom_filter import BloomFilter
+from storage import DynamoDBStorage, SQLiteStorage, STARTED, PAID, INVITED
+from resilience import (
+    CircuitBreaker, CommitSpool, Deadline, DependencyUnavailable, guarded_call, hedged_call,
+)
+from receipt_archive import ReceiptArchiver, content_key, content_type_for, transcode_receipt
+from update_processor import PerUserUpdateProcessor
+from ocr_executor import OCRExecutor, OCRTimeout
+from verification_queue import RecentlyShed, VerificationQueue, VerificationQueueFull
+import ocr_backends
+from receipt_preprocess import preprocess_receipt
+from ocr_cache import ReceiptCache
+from user_cache import UserStatusCache
+from write_behind import WriteBehindBuffer
+from receipt_phash import ReceiptHashIndex, dhash_bytes
+from receipt_fields import extract_fields
+from receipt_layout import group_rows, read_fields, rows_to_text
+from receipt_locale import detect_locale, normalize_myanmar
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
@@ -26,18 +49,62 @@ if platform.system() == "Windows":
 else:
     pytesseract.pytesseract.tesseract_cmd = "tesseract"
 
-# -------------------- AWS Setup --------------------
-dynamodb = boto3.resource(
-    'dynamodb',
-    aws_access_key_id=creds.AWS_ACCESS_KEY,
-    aws_secret_access_key=creds.AWS_SECRET_KEY,
-    region_name=creds.REGION_NAME
+# -------------------- Storage Setup --------------------
+# Storage calls are blocking; handlers await them on this thread pool so one
+# user's round trip does not stall everyone else. It also holds the
+# per-thread AWS sessions, created on first use only.
+io_pool = AWSExecutor(aws_clients.new_session, max_workers=getattr(creds, "AWS_IO_WORKERS", 16))
+
+# "dynamodb" (default) or "sqlite" for a single host or an offline run:
+# SQLITE_PATH holds the tables, RECEIPTS_DIR the receipt images.
+STORAGE_BACKEND = getattr(creds, "STORAGE_BACKEND", "dynamodb")
+if STORAGE_BACKEND == "sqlite":
+    storage = SQLiteStorage(
+        getattr(creds, "SQLITE_PATH", "merxylab.db"),
+        receipts_dir=getattr(creds, "RECEIPTS_DIR", "receipts"),
+    )
+else:
+    storage = DynamoDBStorage(io_pool, getattr(creds, "BUCKET_NAME", None))
+
+# Every payment gets PAYMENT_BUDGET seconds end to end; each storage call
+# may use what is left of it, capped per call (receipt uploads, which run
+# in the background, by RECEIPT_UPLOAD_TIMEOUT). A dependency that keeps
+# failing is skipped by its breaker, and verified receipts are spooled to
+# PENDING_PAYMENTS_DIR and committed once storage answers again.
+PAYMENT_BUDGET = getattr(creds, "PAYMENT_BUDGET", 90)
+STORAGE_CALL_TIMEOUT = getattr(creds, "STORAGE_CALL_TIMEOUT", 5)
+STORAGE_HEDGE_AFTER = getattr(creds, "STORAGE_HEDGE_AFTER", 0.2)
+RECEIPT_UPLOAD_TIMEOUT = getattr(creds, "RECEIPT_UPLOAD_TIMEOUT", 15)
+PENDING_RETRY_INTERVAL = getattr(creds, "PENDING_RETRY_INTERVAL", 30)
+storage_breaker = CircuitBreaker(
+    "storage",
+    failure_threshold=getattr(creds, "BREAKER_FAILURES", 5),
+    reset_timeout=getattr(creds, "BREAKER_RESET", 30),
 )
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=creds.AWS_ACCESS_KEY,
-    aws_secret_access_key=creds.AWS_SECRET_KEY,
-    region_name=creds.REGION_NAME
+receipts_breaker = CircuitBreaker(
+    "receipts",
+    failure_threshold=getattr(creds, "BREAKER_FAILURES", 5),
+    reset_timeout=getattr(creds, "BREAKER_RESET", 30),
+)
+pending_payments = CommitSpool(getattr(creds, "PENDING_PAYMENTS_DIR", "pending_payments"))
+
+async def archive_upload(path, key):
+    await guarded_call(
+        receipts_breaker, io_pool.run, upload_receipt, path, key, timeout=RECEIPT_UPLOAD_TIMEOUT
+    )
+
+# Receipts are archived as ARCHIVE_FORMAT (WEBP, or JPEG) at ARCHIVE_QUALITY,
+# at most ARCHIVE_MAX_SIDE pixels on the longer side, under their content hash.
+ARCHIVE_FORMAT = getattr(creds, "ARCHIVE_FORMAT", "WEBP")
+ARCHIVE_QUALITY = getattr(creds, "ARCHIVE_QUALITY", 80)
+ARCHIVE_MAX_SIDE = getattr(creds, "ARCHIVE_MAX_SIDE", 2000)
+
+# Receipt images are uploaded off the critical path: kept in
+# RECEIPT_SPOOL_DIR until ARCHIVE_WORKERS background uploads have stored them.
+archiver = ReceiptArchiver(
+    getattr(creds, "RECEIPT_SPOOL_DIR", "receipt_spool"),
+    archive_upload,
+    workers=getattr(creds, "ARCHIVE_WORKERS", 4),
 )
 
 # -------------------- Telegram States --------------------
@@ -45,86 +112,296 @@ AWAITING_IMAGE = 1
 CHANNEL_ID = creds.CHANNEL_ID
 ADMIN_CHANNEL_ID = creds.ADMIN_CHANNEL_ID
 
+# Updates from different users are handled in parallel, at most
+# MAX_CONCURRENT_UPDATES at a time; each user's updates stay in order.
+# Receipts waiting for OCR hold one each, so keep it well above
+# VERIFY_MAX_DEPTH plus the OCR workers.
+MAX_CONCURRENT_UPDATES = getattr(creds, "MAX_CONCURRENT_UPDATES", 64)
+
+# -------------------- OCR Executor --------------------
+# "auto" uses tesserocr (models stay loaded per worker) when it is installed
+# and falls back to the pytesseract subprocess otherwise; "tesserocr" or
+# "pytesseract" insists on that backend and fails if it cannot be loaded.
+OCR_BACKEND = getattr(creds, "OCR_BACKEND", "auto")
+TESSDATA_PATH = getattr(creds, "TESSDATA_PATH", None)
+
+
+_ocr_lang = None
+
+
+def ocr_lang():
+    """OCR_LANG as far as this host has traineddata for it, else "eng"."""
+    global _ocr_lang
+    if _ocr_lang is None:
+        _ocr_lang = ocr_backends.get_backend(OCR_BACKEND, TESSDATA_PATH).usable_lang(OCR_LANG)
+    return _ocr_lang
+
+
+def init_ocr_worker():
+    lang = ocr_lang()
+    ocr_backends.get_backend(OCR_BACKEND, TESSDATA_PATH).warm_up(
+        dict.fromkeys([lang, "eng", *lang.split("+")])
+    )
+
+
+# Tesseract is CPU bound, so it runs in worker processes; the handler only
+# awaits the result. Default: one worker per core.
+ocr_executor = OCRExecutor(
+    max_workers=getattr(creds, "OCR_WORKERS", None),
+    timeout=getattr(creds, "OCR_TIMEOUT", 60),
+    initializer=init_ocr_worker,
+)
+
+# Receipts that need OCR wait here for one of the OCR workers, users who
+# were turned away first. At most VERIFY_MAX_DEPTH wait; past that the user
+# is told when to try again, and their next try within VERIFY_RETRY_WINDOW
+# seconds jumps ahead of new arrivals.
+VERIFY_PRIORITY_RETRY = 0
+VERIFY_PRIORITY_NEW = 1
+verification_queue = VerificationQueue(
+    workers=ocr_executor.max_workers,
+    max_depth=getattr(creds, "VERIFY_MAX_DEPTH", 32),
+    notify_interval=getattr(creds, "VERIFY_NOTIFY_INTERVAL", 3),
+)
+turned_away = RecentlyShed(ttl=getattr(creds, "VERIFY_RETRY_WINDOW", 600))
+
+# Keep downloaded receipts in memory (no temp file in the working directory).
+# Set RECEIPT_IN_MEMORY = False in creds to go back to download_to_drive.
+RECEIPT_IN_MEMORY = getattr(creds, "RECEIPT_IN_MEMORY", True)
+
+# Crop / grayscale / binarize / rescale before OCR. Off by default until the
+# latency and extraction numbers from the OCR log lines have been compared.
+OCR_PREPROCESS = getattr(creds, "OCR_PREPROCESS", False)
+OCR_CROP_BOX = getattr(creds, "OCR_CROP_BOX", None)
+
+# Read fields from word boxes and confidences, re-reading only unsure field
+# crops. False goes back to plain image_to_string + extract_fields.
+OCR_LAYOUT = getattr(creds, "OCR_LAYOUT", True)
+
+# One combined pass reads both English- and Burmese-locale receipts; Myanmar
+# digits and labels are normalized afterwards instead of re-running OCR.
+# A language without installed traineddata is left out (see ocr_lang).
+OCR_LANG = getattr(creds, "OCR_LANG", "eng+mya")
+
+# Resubmitted screenshots are answered from here instead of re-running OCR.
+# RECEIPT_CACHE_DIR keeps results across restarts, up to RECEIPT_CACHE_DISK_BYTES.
+receipt_cache = ReceiptCache(
+    io_pool.run,
+    max_bytes=getattr(creds, "RECEIPT_CACHE_BYTES", 32 * 1024 * 1024),
+    disk_dir=getattr(creds, "RECEIPT_CACHE_DIR", None),
+    disk_max_bytes=getattr(creds, "RECEIPT_CACHE_DISK_BYTES", 256 * 1024 * 1024),
+    namespace=f"{OCR_PREPROCESS}:{OCR_CROP_BOX}:{OCR_LAYOUT}:{OCR_LANG}",
+)
+
+# Perceptual hashes of every committed receipt. KBZPay receipts share one
+# layout, so a close hash only hints that a receipt may have been used
+# before: the transaction number decides, and a hit on an accepted payment
+# is flagged to the admins. Off until PHASH_MAX_DISTANCE has been tuned on
+# real receipts. Build it from the bucket with: python receipt_phash.py backfill
+receipt_index = None
+if getattr(creds, "PHASH_ENABLED", False):
+    receipt_index = ReceiptHashIndex(
+        getattr(creds, "PHASH_INDEX_PATH", "receipt_phash.jsonl"),
+        max_distance=getattr(creds, "PHASH_MAX_DISTANCE", 8),
+    )
+
+# started / paid / invited flags, so repeated commands from the same user
+# are answered without database reads. Writes below update it in place.
+user_status = UserStatusCache(
+    max_entries=getattr(creds, "USER_CACHE_ENTRIES", 10000),
+    ttl=getattr(creds, "USER_CACHE_TTL", 600),
+    negative_ttl=getattr(creds, "USER_CACHE_NEGATIVE_TTL", 60),
+)
+
+# Every reserved transaction number, loaded at startup, so the duplicate
+# pre-check only goes to the database for numbers that may have been used.
+# The filter never has false negatives; a number committed elsewhere after
+# the load is still caught by the conditional reservation in commit_payment.
+transaction_filter = None
+if getattr(creds, "TXN_FILTER_ENABLED", True):
+    transaction_filter = BloomFilter(
+        capacity=getattr(creds, "TXN_FILTER_CAPACITY", 1_000_000),
+        error_rate=getattr(creds, "TXN_FILTER_ERROR_RATE", 0.001),
+        max_bytes=getattr(creds, "TXN_FILTER_MAX_BYTES", None),
+    )
+TXN_FILTER_SEGMENTS = getattr(creds, "TXN_FILTER_SEGMENTS", 8)
+
 # -------------------- DB Helpers --------------------
-def log_payment_to_dynamodb(user_id, username, file_name, extracted_data: dict):
-    table = dynamodb.Table('merxylab-payment')
-    item = {
+def payment_item(user_id, username, file_name, extracted_data: dict, s3_key=None):
+    return {
         "user_id": str(user_id),
         "username": username or "N/A",
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "file_name": file_name,
+        # Uploaded in the background by the archiver, after the commit.
+        "s3_key": s3_key or f"payments/{file_name}",
         "transaction_no": extracted_data.get("Transaction No", ""),
         "amount": extracted_data.get("Amount", ""),
         "transaction_time": extracted_data.get("Transaction Time", ""),
         "notes": extracted_data.get("Notes", "")
     }
-    table.put_item(Item=item)
-
 
 def mark_user_as_invited(user_id):
-    table = dynamodb.Table('merxylab-invited_users')
-    table.put_item(Item={"user_id": str(user_id), "invited": True})
-
-def has_user_been_invited(user_id):
-    table = dynamodb.Table('merxylab-invited_users')
-    response = table.get_item(Key={"user_id": str(user_id)})
-    return response.get("Item", {}).get("invited", False)
+    storage.put_item(INVITED, {"user_id": str(user_id), "invited": True})
+    user_status.set(INVITED, user_id, True)
 
+# Transaction numbers are the key of their own table, so both the lookup and
+# the reservation (see commit_payment) are single-item operations however
+# many payments exist.
+# Existing DynamoDB payments are copied in with: python migrate_transactions.py
 def is_duplicate_transaction(transaction_no: str) -> bool:
-    table = dynamodb.Table('merxylab-payment')
-    try:
-        response = table.scan(
-            FilterExpression=Attr('transaction_no').eq(transaction_no)
-        )
-        return response['Count'] > 0
-    except Exception as e:
-        logger.error(f"[DynamoDB ERROR] Duplicate check failed: {e}")
+    return storage.is_duplicate_transaction(transaction_no)
+
+def transaction_owner(transaction_no: str):
+    return storage.transaction_owner(transaction_no)
+
+def may_be_duplicate_transaction(transaction_no: str) -> bool:
+    """False only when the transaction number is certainly unused."""
+    if transaction_filter is None or not transaction_filter.loaded:
+        return True
+    return transaction_no in transaction_filter
+
+def scan_transaction_segment(segment, total_segments):
+    """Add one segment of the reserved transaction numbers to the filter."""
+    for transaction_no in storage.transaction_numbers(segment, total_segments):
+        transaction_filter.add(transaction_no)
+
+async def load_transaction_filter():
+    # Segments are scanned in parallel on the I/O pool. Until the load
+    # finishes every payment keeps using the remote lookup.
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        io_pool.run(scan_transaction_segment, segment, TXN_FILTER_SEGMENTS)
+        for segment in range(TXN_FILTER_SEGMENTS)
+    ))
+    transaction_filter.loaded = True
+    logger.info(
+        f"[TXN FILTER] {transaction_filter.count} numbers in {time.perf_counter() - started:.1f}s, "
+        f"{transaction_filter.size_bytes} bytes, "
+        f"est. false positives {transaction_filter.estimated_error_rate():.4%}"
+    )
+
+def commit_payment(user, file_name, extracted_data: dict, s3_key=None) -> bool:
+    """Record a verified payment all-or-nothing (one TransactWriteItems call
+    on DynamoDB, one SQL transaction on SQLite).
+
+    Writes the payment record, reserves the transaction number and marks the
+    user as paid. Returns False, with nothing written, when the transaction
+    number was already reserved; any other failure is raised.
+    """
+    transaction_no = extracted_data.get("Transaction No", "")
+    payment = payment_item(user.id, user.username, file_name, extracted_data, s3_key)
+    if not storage.commit_payment(payment, paid_user_item(user, transaction_no)):
         return False
+    user_status.set(PAID, user.id, True)
+    if transaction_filter is not None:
+        transaction_filter.add(transaction_no)
+    return True
 
-def mark_user_as_started(user_id):
-    table = dynamodb.Table('merxylab-startedusers')
-    table.put_item(Item={
+def started_user_item(user_id):
+    return {
         "user_id": str(user_id),
         "has_started": True,
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    })
+    }
+
+def write_batches(batches):
+    """Write-behind flush: one batch write per record kind."""
+    for kind, items in batches.items():
+        storage.put_items(kind, items)
+
+# Analytics-style writes (who pressed /start) are buffered and written in
+# batches, so /start never waits on the database.
+write_behind = WriteBehindBuffer(
+    write_batches,
+    io_pool.run,
+    flush_size=getattr(creds, "WRITE_BEHIND_BATCH", 25),
+    flush_interval=getattr(creds, "WRITE_BEHIND_INTERVAL", 5.0),
+    max_items=getattr(creds, "WRITE_BEHIND_MAX_ITEMS", 10000),
+)
 
-def has_user_started(user_id):
-    table = dynamodb.Table('merxylab-startedusers')
-    response = table.get_item(Key={"user_id": str(user_id)})
-    return response.get("Item", {}).get("has_started", False)
+def record_user_started(user_id):
+    write_behind.add(STARTED, str(user_id), started_user_item(user_id))
+    user_status.set(STARTED, user_id, True)
 
-def mark_user_as_paid(user, transaction_no):
-    table = dynamodb.Table('merxylab-paid_users')
-    table.put_item(Item={
+def paid_user_item(user, transaction_no):
+    return {
         "user_id": str(user.id),
         "name": user.full_name,
         "username": user.username or "N/A",
         "has_paid": True,
         "payment_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "transaction_no": transaction_no
-    })
+    }
+
+USER_FLAGS = (STARTED, PAID, INVITED)
 
-def has_user_paid(user_id):
-    table = dynamodb.Table('merxylab-paid_users')
-    response = table.get_item(Key={"user_id": str(user_id)})
-    return response.get("Item", {}).get("has_paid", False)
+def get_user_state(user_id):
+    """Started / paid / invited flags and the last transaction number, in one read."""
+    return storage.get_user_state(user_id)
+
+def load_user_state(user_id):
+    """get_user_state, remembering every flag so the next command is free."""
+    state = get_user_state(user_id)
+    for kind in USER_FLAGS:
+        user_status.set(kind, user_id, state[kind])
+    return state
+
+def upload_receipt(source, key):
+    """Store a receipt from a file path or from bytes, unless it is already there.
+
+    Keys are content hashes, so an existing object holds the same image.
+    """
+    if storage.has_receipt(key):
+        logger.info(f"[S3] {key} already stored, upload skipped")
+        return
+    storage.put_receipt(source, key, content_type_for(key))
+
+# Awaitable versions for the handlers. A cached flag is answered on the
+# event loop; only a miss goes to the I/O pool, and one miss loads them all.
+async def user_flag_async(kind, user_id, fallback=None):
+    value = user_status.get(kind, user_id, None)
+    if value is None:
+        try:
+            state = await hedged_call(
+                storage_breaker, io_pool.run, load_user_state, user_id,
+                hedge_after=STORAGE_HEDGE_AFTER, timeout=STORAGE_CALL_TIMEOUT,
+            )
+        except DependencyUnavailable as e:
+            if fallback is None:
+                raise
+            logger.warning(f"[DEGRADED] {kind} flag of {user_id} unavailable: {e}")
+            return fallback
+        value = state[kind]
+    return value
+
+# While storage is down: /start skips recording the user, and /pay and
+# /payment_confirm let them through (the commit still rejects duplicates).
+async def has_user_started_async(user_id):
+    return await user_flag_async(STARTED, user_id, fallback=True)
+
+async def has_user_paid_async(user_id):
+    return await user_flag_async(PAID, user_id, fallback=False)
+
+async def has_user_been_invited_async(user_id):
+    return await user_flag_async(INVITED, user_id)
 
 # -------------------- Commands --------------------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if not has_user_started(user_id):
-        mark_user_as_started(user_id)
-
     await update.message.reply_text(
         "👋 Hello, welcome from Merxy's Lab.\n"
         "This is Merxy's Assistant, who will help you buy the course.\n\n"
         "If you decide to buy, please click /pay."
     )
 
+    # Recorded after replying; only the first /start per user is kept.
+    if not await has_user_started_async(user_id):
+        record_user_started(user_id)
+
 async def pay(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if has_user_paid(user_id):
+    if await has_user_paid_async(user_id):
         await update.message.reply_text(
             "💚 Thank you! Your payment has already been confirmed.\n\n"
             "If you haven't received your access, please contact support."
@@ -156,7 +433,7 @@ async def end(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def start_payment_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if has_user_paid(user_id):
+    if await has_user_paid_async(user_id):
         await update.message.reply_text(
             "💚 Thank you! Your payment has already been confirmed.\n\n"
             "If you haven't received your access or need help, please contact support."
@@ -218,11 +495,30 @@ def clean_kbz_ocr_text(text: str) -> str:
     return cleaned_text
 
 
-def extract_text_from_image(image_path):
-    image = Image.open(image_path)
-    text = pytesseract.image_to_string(image, lang='eng')
-    if not re.search(r'[a-zA-Z]', text):
-        text = pytesseract.image_to_string(image, lang='mya')
+def open_receipt_image(image):
+    """Open a receipt from a file path or from downloaded bytes."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(memoryview(image)))
+    return Image.open(image)
+
+
+def prepare_ocr_image(image):
+    image = open_receipt_image(image)
+    if OCR_PREPROCESS:
+        image = preprocess_receipt(image, OCR_CROP_BOX)
+    return image
+
+
+def extract_text_from_image(image):
+    started = time.perf_counter()
+    image = prepare_ocr_image(image)
+    backend = ocr_backends.get_backend(OCR_BACKEND, TESSDATA_PATH)
+    raw_text = backend.image_to_string(image, lang=ocr_lang())
+    text = normalize_myanmar(raw_text)
+    logger.info(
+        f"[OCR] {time.perf_counter() - started:.3f}s preprocess={OCR_PREPROCESS} "
+        f"size={image.width}x{image.height} locale={detect_locale(raw_text)}"
+    )
 
     # Clean garbage footer
     text = clean_kbz_ocr_text(text)
@@ -230,112 +526,385 @@ def extract_text_from_image(image_path):
     return text
 
 
-def extract_fields(text):
-    result = {
-        "time": None,
-        "transaction_id": None,
-        "amount": None,
-        "name": None,
-        "notes": None
+def read_receipt_layout(image):
+    started = time.perf_counter()
+    image = prepare_ocr_image(image)
+    backend = ocr_backends.get_backend(OCR_BACKEND, TESSDATA_PATH)
+    words = backend.image_to_data(image, lang=ocr_lang())
+    locale = detect_locale(" ".join(w["text"] for w in words))
+    for word in words:
+        word["text"] = normalize_myanmar(word["text"]).strip()
+    rows = group_rows(words)
+    text = clean_kbz_ocr_text(rows_to_text(rows))
+
+    fields, rereads = read_fields(image, rows, backend)
+    # Anything the layout pass could not place comes from the text parser
+    parsed = extract_fields(text)
+    for key, value in fields.items():
+        if value is None:
+            fields[key] = parsed[key]
+    logger.info(
+        f"[OCR] {time.perf_counter() - started:.3f}s locale={locale} rereads={rereads} "
+        f"size={image.width}x{image.height}"
+    )
+    return {"text": text, "fields": fields}
+
+
+def read_receipt(image):
+    """OCR job run in the worker pool: text plus the extracted fields."""
+    if OCR_LAYOUT:
+        return read_receipt_layout(image)
+    text = extract_text_from_image(image)
+    return {"text": text, "fields": extract_fields(text)}
+
+def queue_status_reporter(message):
+    """on_position callback: one status reply, edited as the queue moves."""
+    status = None
+    lock = asyncio.Lock()
+
+    async def report(position):
+        nonlocal status
+        async with lock:
+            if position:
+                text = f"⏳ Lots of payments are being verified right now.\n\nYou are #{position} in the queue."
+            else:
+                text = "🔎 Reading your screenshot..."
+            if status is None:
+                if position:
+                    status = await message.reply_text(text)
+            else:
+                await status.edit_text(text)
+
+    return report
+
+# -------------------- Payment Commit --------------------
+async def store_payment(user, payment, image_bytes, deadline=None) -> bool:
+    """Duplicate check, receipt upload and commit for a validated receipt.
+
+    Returns False when the transaction number was already used. Raises
+    DependencyUnavailable, with nothing committed, when storage could not
+    be reached within the deadline.
+    """
+    fields = payment["fields"]
+    transaction_no = fields["transaction_id"]
+
+    # ✅ Check for duplicate transaction before uploading anything
+    if may_be_duplicate_transaction(transaction_no) and await hedged_call(
+        storage_breaker, io_pool.run, is_duplicate_transaction, transaction_no,
+        hedge_after=STORAGE_HEDGE_AFTER, deadline=deadline, timeout=STORAGE_CALL_TIMEOUT,
+    ):
+        return False
+
+    # ✅ Compact archival copy, keyed by its content hash, kept in the local
+    # spool; the S3 upload happens after the commit
+    archived, fmt = await io_pool.run(
+        transcode_receipt, image_bytes, ARCHIVE_FORMAT, ARCHIVE_QUALITY, ARCHIVE_MAX_SIDE
+    )
+    s3_key = content_key(archived, fmt)
+    payment["s3_key"] = s3_key
+    payment["staged"] = await io_pool.run(archiver.stage, archived, s3_key)
+
+    # ✅ Save payment, transaction reservation and paid flag atomically.
+    # The reservation is conditional, so a receipt submitted twice at the
+    # same moment is only accepted once.
+    try:
+        committed = await guarded_call(storage_breaker, io_pool.run, commit_payment, user, payment["filename"], {
+            "Transaction No": transaction_no,
+            "Amount": fields["amount"],
+            "Transaction Time": fields["time"],
+            "Notes": fields["notes"]
+        }, s3_key, deadline=deadline, timeout=STORAGE_CALL_TIMEOUT)
+    except DependencyUnavailable:
+        # A timed-out commit may still land: keep the staged receipt for
+        # retry_pending_payments, which knows how the payment ended.
+        raise
+    if not committed:
+        archiver.discard(payment["staged"])
+        return False
+
+    archive_receipt(payment)
+    return True
+
+def archive_receipt(payment):
+    """Upload a committed payment's staged receipt in the background.
+
+    The payment is committed already, so a failure here is only logged.
+    """
+    try:
+        archiver.submit(payment["staged"])
+        # A queued payment may have been hashed while PHASH_ENABLED was on.
+        if receipt_index is not None and payment.get("receipt_hash") is not None:
+            receipt_index.add(payment["receipt_hash"], payment["s3_key"])
+    except Exception as e:
+        logger.error(f"[ARCHIVE] Could not archive receipt {payment['s3_key']}: {e}")
+
+async def announce_payment(bot, chat_id, user, payment, committed):
+    """Tell the user (with their invite link) and the admins how it went."""
+    fields = payment["fields"]
+    transaction_no = fields["transaction_id"]
+    if not committed:
+        await bot.send_message(
+            chat_id=chat_id,
+            text=(
+                "⚠️ This transaction has already been used.\n\n"
+                "If you believe this is an error, please contact support."
+            ),
+        )
+        return
+
+    # ✅ Build reply summary
+    summary = (
+        f"*Transaction No:* `{transaction_no}`\n"
+        f"*Amount:* `{fields['amount']}`\n"
+        f"*Time:* `{fields['time']}`\n"
+        f"*Notes:* `{fields['notes'] or 'N/A'}`"
+    )
+
+    await bot.send_message(chat_id=chat_id, text="✅ Payment successfully verified!")
+    await bot.send_message(chat_id=chat_id, text=f"📟 *Payment Details:*\n{summary}", parse_mode="Markdown")
+
+    # ✅ Send invite link if not already sent
+    invited = False
+    try:
+        invited = await has_user_been_invited_async(user.id)
+        if not invited:
+            invite_link = await bot.create_chat_invite_link(
+                chat_id=CHANNEL_ID,
+                member_limit=1
+            )
+            await bot.send_message(
+                chat_id=chat_id,
+                text=(
+                    f"📩 Here is your exclusive access link (valid for 24 hours):\n"
+                    f"{invite_link.invite_link}\n\n"
+                    "⚠️ This link can only be used once. Don't share it with others."
+                ),
+            )
+            invited = True
+            await io_pool.run(mark_user_as_invited, user.id)
+    except Exception as e:
+        logger.error(f"Failed to create invite link: {e}")
+        if not invited:
+            await bot.send_message(
+                chat_id=chat_id,
+                text=(
+                    "✅ Payment verified but failed to generate access link.\n\n"
+                    "Please contact support with your transaction number."
+                ),
+            )
+
+    # ✅ Notify admin
+    await bot.send_message(
+        chat_id=ADMIN_CHANNEL_ID,
+        text=(
+            f" *New Payment Confirmed!*\n\n"
+            f" *User:* `{user.full_name}` (`{user.id}`)\n"
+            f" *File:* `{payment['filename']}`\n"
+            f" *Amount:* `{fields['amount']}`\n"
+            f" *Time:* `{fields['time']}`\n"
+            f" *Transaction No:* `{transaction_no}`\n"
+            f" *Notes:* `{fields['notes'] or 'N/A'}`\n"
+            f" *Invite Sent:* `{invited}`"
+        ),
+        parse_mode="Markdown"
+    )
+    if payment.get("phash_match"):
+        distance, matched_key = payment["phash_match"]
+        await bot.send_message(
+            chat_id=ADMIN_CHANNEL_ID,
+            text=(
+                f"⚠️ *Possible Reused Receipt*\n"
+                f"👤 *User ID:* `{user.id}`\n"
+                f"🧾 *Transaction No:* `{transaction_no}`\n"
+                f"🔁 *Looks like:* `{matched_key}` (distance {distance})\n"
+                "Accepted: the transaction number is new. Please check."
+            ),
+            parse_mode="Markdown"
+        )
+
+async def defer_payment(bot, chat_id, user, payment, image_bytes, error):
+    """Degraded mode: spool a verified receipt for retry_pending_payments."""
+    record = {
+        "chat_id": chat_id,
+        "user": {"id": user.id, "full_name": user.full_name, "username": user.username},
+        **payment,
     }
+    pending_payments.add(record, image_bytes)
+    logger.warning(f"[DEGRADED] Queued payment {payment['fields']['transaction_id']}: {error}")
+    await bot.send_message(
+        chat_id=chat_id,
+        text=(
+            "✅ Your screenshot was read successfully.\n\n"
+            "We're finishing the confirmation and will message you here "
+            "with your access link shortly."
+        ),
+    )
+    await bot.send_message(
+        chat_id=ADMIN_CHANNEL_ID,
+        text=(
+            f"⏳ *Payment Queued*\n"
+            f"👤 *User ID:* `{user.id}`\n"
+            f"🧾 *Transaction No:* `{payment['fields']['transaction_id']}`\n"
+            f"❌ *Reason:* `{error}`"
+        ),
+        parse_mode="Markdown"
+    )
 
-    text = re.sub(r'\s+', ' ', text).strip()
-
-    # English format
-    eng_time = re.search(r'Transaction Time\s*([\d/]+ [\d:]+)', text)
-    eng_id = re.search(r'Transaction No\.?\s*(\d{16,20})', text)
-    eng_amount = re.search(r'Amount\s*(-?\d[\d,]*\.?\d*)\s*Ks', text)
-
-    if eng_time or eng_id or eng_amount:
-        if eng_time:
-            result["time"] = eng_time.group(1)
-        if eng_id:
-            result["transaction_id"] = eng_id.group(1)
-        if eng_amount:
-            amount = eng_amount.group(1).replace(',', '')
-            result["amount"] = f"{amount} Ks"
-
-        name_match = re.search(r'Transfer To\s*([A-Z][A-Za-z\s]+)\s*[\(<]?[*#]+(\d{4})[\)>]?', text)
-        if not name_match:
-            name_match = re.search(r'Transfer To\s*([A-Z][A-Za-z\s]+)\s*[*#]+\d{4}', text)
-        if name_match:
-            result["name"] = f"{name_match.group(1).strip()} ({name_match.group(2) if len(name_match.groups()) > 1 else name_match.group(1).split()[-1]})"
-
-        notes_match = re.search(r'Notes\s*([^\n]+?)(?=\s*(?:Transaction|Transfer|Amount|$))', text)
-        if notes_match:
-            result["notes"] = notes_match.group(1).strip()
+async def retry_pending_payment(record, image_bytes):
+    user = SimpleNamespace(**record["user"])
+    # What the first attempt staged, if it got that far; store_payment
+    # stages a copy of its own.
+    s3_key, staged = record.get("s3_key"), record.get("staged")
+    try:
+        committed = await store_payment(user, record, image_bytes, Deadline(PAYMENT_BUDGET))
+    except DependencyUnavailable:
+        # The queued record still names the first attempt's entry, or none
+        # and the receipt is staged again below when needed.
+        if record.get("staged") not in (None, staged):
+            archiver.discard(record["staged"])
+        raise
+    if committed:
+        if staged:
+            archiver.discard(staged)
+        return True
+    # The first attempt may have been committed after its deadline; then
+    # the number is reserved by this same user and the payment points at
+    # the receipt that attempt staged.
+    owner = await guarded_call(
+        storage_breaker, io_pool.run, transaction_owner, record["fields"]["transaction_id"],
+        timeout=STORAGE_CALL_TIMEOUT,
+    )
+    if owner != str(user.id):
+        if staged:
+            archiver.discard(staged)
+        return False
+    record["s3_key"], record["staged"] = s3_key, staged
+    if s3_key:
+        try:
+            if not (staged and archiver.is_staged(staged)):
+                archived, _ = await io_pool.run(
+                    transcode_receipt, image_bytes, ARCHIVE_FORMAT, ARCHIVE_QUALITY, ARCHIVE_MAX_SIDE
+                )
+                record["staged"] = await io_pool.run(archiver.stage, archived, s3_key)
+        except Exception as e:
+            logger.error(f"[ARCHIVE] Could not stage receipt {s3_key} again: {e}")
         else:
-            amount_pos = text.find('Amount') if 'Amount' in text else -1
-            if amount_pos > -1:
-                notes_part = text[amount_pos:].split('Ks')[-1].strip()
-                if notes_part and not any(x in notes_part for x in ['Transaction', 'Transfer']):
-                    result["notes"] = notes_part.split('\n')[0].strip()
-
-        return result
-
-    # Myanmar fallback
-    my_time = re.search(r'(\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2})', text)
-    my_id = re.search(r'(\d{16,20})', text)
-    my_amount = re.search(r'(-?\d[\d,]*\.?\d*)\s*Ks', text)
-
-    if my_time or my_id or my_amount:
-        if my_time:
-            result["time"] = my_time.group(1)
-        if my_id:
-            result["transaction_id"] = my_id.group(1)
-        if my_amount:
-            amount = my_amount.group(1).replace(',', '')
-            result["amount"] = f"{amount} Ks"
-
-        name_match = re.search(r'([A-Z][A-Za-z\s]+)\s*[\(<]?[*#]+(\d{4})[\)>]?', text)
-        if not name_match:
-            name_match = re.search(r'([A-Z][A-Za-z\s]+)\s*[*#]+\d{4}', text)
-        if name_match:
-            result["name"] = f"{name_match.group(1).strip()} ({name_match.group(2) if len(name_match.groups()) > 1 else name_match.group(1).split()[-1]})"
-
-        amount_pos = text.find('Ks') if 'Ks' in text else -1
-        if amount_pos > -1:
-            notes_part = text[amount_pos+2:].strip()
-            if notes_part and not any(x in notes_part for x in ['Transaction', 'Transfer']):
-                result["notes"] = notes_part.split('\n')[0].strip()
-
-        return result
-
-    # Fallback
-    time_match = re.search(r'(\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2})', text)
-    id_match = re.search(r'(\d{16,20})', text)
-    amount_match = re.search(r'(-?\d[\d,]*\.?\d*)\s*Ks', text)
-
-    if time_match:
-        result["time"] = time_match.group(1)
-    if id_match:
-        result["transaction_id"] = id_match.group(1)
-    if amount_match:
-        amount = amount_match.group(1).replace(',', '')
-        result["amount"] = f"{amount} Ks"
-
-    name_match = re.search(r'([A-Z][A-Za-z\s]+)\s*[\(<]?[*#]+(\d{4})[\)>]?', text)
-    if not name_match:
-        name_match = re.search(r'([A-Z][A-Za-z\s]+)\s*[*#]+\d{4}', text)
-    if name_match:
-        result["name"] = f"{name_match.group(1).strip()} ({name_match.group(2) if len(name_match.groups()) > 1 else name_match.group(1).split()[-1]})"
-
-    return result
+            archive_receipt(record)
+    return True
+
+async def retry_pending_payments(bot):
+    """Commit spooled payments, oldest first, until storage fails again.
+
+    An entry that fails for any other reason before it is committed is
+    quarantined, so it cannot block the ones behind it. Once committed
+    (or rejected) an entry is removed and announced; nothing after the
+    commit can send it to quarantine.
+    """
+    for entry_id in pending_payments.ids():
+        try:
+            record, image_bytes = pending_payments.load(entry_id)
+            user = SimpleNamespace(**record["user"])
+            committed = await retry_pending_payment(record, image_bytes)
+        except DependencyUnavailable as e:
+            logger.warning(f"[DEGRADED] Storage still unavailable, {len(pending_payments)} queued: {e}")
+            return
+        except Exception as e:
+            logger.error(f"[DEGRADED] Quarantined payment {entry_id}: {e}")
+            pending_payments.quarantine(entry_id)
+            try:
+                await bot.send_message(
+                    chat_id=ADMIN_CHANNEL_ID,
+                    text=(
+                        f"🚨 *Queued Payment Failed*\n"
+                        f"🗂️ *Entry:* `{entry_id}` (moved to failed/)\n"
+                        f"❌ *Error:* `{e}`"
+                    ),
+                    parse_mode="Markdown"
+                )
+            except Exception as e:
+                logger.error(f"[DEGRADED] Could not report payment {entry_id}: {e}")
+            continue
+        # Committed (or rejected): never retried again, even if the
+        # messages below fail.
+        pending_payments.remove(entry_id)
+        try:
+            await announce_payment(bot, record["chat_id"], user, record, committed)
+        except Exception as e:
+            logger.error(f"[DEGRADED] Could not announce payment {entry_id}: {e}")
+
+async def pending_payments_loop(bot):
+    while True:
+        await asyncio.sleep(PENDING_RETRY_INTERVAL)
+        try:
+            if pending_payments.ids():
+                await retry_pending_payments(bot)
+        except Exception as e:
+            logger.error(f"[DEGRADED] Retrying queued payments failed: {e}")
 
 # -------------------- Image Handler --------------------
 async def handle_payment_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_id = user.id
+    deadline = Deadline(PAYMENT_BUDGET)
     photo_file = await update.message.photo[-1].get_file()
     now_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{user_id}_{now_str}.png"
+    # The message id keeps two uploads from the same user in one second apart.
+    filename = f"{user_id}_{now_str}_{update.message.message_id}.jpg"
 
-    await photo_file.download_to_drive(filename)
+    if RECEIPT_IN_MEMORY:
+        image_data = await photo_file.download_as_bytearray()
+    else:
+        await photo_file.download_to_drive(filename)
+        image_data = None
 
     try:
+        if image_data is None:
+            with open(filename, "rb") as f:
+                image_bytes = f.read()
+        else:
+            image_bytes = image_data
+
+        # A close perceptual hash is only a hint for the admins; the
+        # transaction number check below decides
+        receipt_hash = None
+        phash_match = None
+        if receipt_index is not None:
+            receipt_hash = dhash_bytes(image_bytes)
+            phash_match = receipt_index.find(receipt_hash)
+
         # OCR and extraction using new logic
-        extracted_text = extract_text_from_image(filename)
-        extracted_fields = extract_fields(extracted_text)
+        cache_key = receipt_cache.key_for(image_bytes)
+        receipt = await receipt_cache.get(cache_key)
+        if receipt is None:
+            priority = VERIFY_PRIORITY_RETRY if turned_away.pop(user_id) else VERIFY_PRIORITY_NEW
+            try:
+                release = await verification_queue.acquire(priority, queue_status_reporter(update.message))
+                # The latency budget starts once the receipt leaves the
+                # queue; time spent waiting for a slot is not held against
+                # OCR or the commit.
+                deadline = Deadline(PAYMENT_BUDGET)
+                # The slot is given back when the worker returns: a job that
+                # timed out keeps its worker, so it keeps its slot too.
+                receipt = await ocr_executor.run(
+                    read_receipt, image_bytes,
+                    timeout=min(ocr_executor.timeout, deadline.remaining()), on_done=release,
+                )
+            except VerificationQueueFull as e:
+                turned_away.add(user_id)
+                await update.message.reply_text(
+                    "⏳ We're verifying a lot of payments right now.\n\n"
+                    f"Please try again in {e.retry_after} seconds with /payment_confirm"
+                )
+                return ConversationHandler.END
+            except OCRTimeout:
+                logger.error(f"[OCR TIMEOUT] user {user_id} file {filename}")
+                await update.message.reply_text(
+                    "⚠️ Reading your screenshot took too long.\n\n"
+                    "Please try again with /payment_confirm"
+                )
+                return ConversationHandler.END
+            await receipt_cache.put(cache_key, receipt)
+        extracted_fields = receipt["fields"]
 
         # Ensure required fields exist
         if not extracted_fields["transaction_id"] or not extracted_fields["amount"]:
@@ -390,75 +959,21 @@ async def handle_payment_image(update: Update, context: ContextTypes.DEFAULT_TYP
             await update.message.reply_text("⚠️ Could not interpret the amount properly.")
             return ConversationHandler.END
 
-        transaction_no = extracted_fields["transaction_id"]
-
-        # ✅ Check for duplicate transaction
-        if is_duplicate_transaction(transaction_no):
-            await update.message.reply_text(
-                "⚠️ This transaction has already been used.\n\n"
-                "If you believe this is an error, please contact support."
-            )
+        payment = {
+            "filename": filename,
+            "fields": extracted_fields,
+            "receipt_hash": receipt_hash,
+            "phash_match": phash_match,
+        }
+        try:
+            committed = await store_payment(user, payment, image_bytes, deadline)
+        except DependencyUnavailable as e:
+            # Storage is down or too slow: keep the verified receipt and
+            # commit it later instead of failing the user.
+            await defer_payment(context.bot, update.effective_chat.id, user, payment, image_bytes, e)
             return ConversationHandler.END
 
-        # ✅ Upload image to S3
-        s3.upload_file(filename, creds.BUCKET_NAME, f"payments/{filename}")
-
-        # ✅ Save to DynamoDB
-        log_payment_to_dynamodb(user_id, user.username, filename, {
-            "Transaction No": transaction_no,
-            "Amount": extracted_fields["amount"],
-            "Transaction Time": extracted_fields["time"],
-            "Notes": extracted_fields["notes"]
-        })
-
-        mark_user_as_paid(user, transaction_no)
-
-        # ✅ Build reply summary
-        summary = (
-            f"*Transaction No:* `{transaction_no}`\n"
-            f"*Amount:* `{extracted_fields['amount']}`\n"
-            f"*Time:* `{extracted_fields['time']}`\n"
-            f"*Notes:* `{extracted_fields['notes'] or 'N/A'}`"
-        )
-
-        await update.message.reply_text("✅ Payment successfully verified!")
-        await update.message.reply_text(f"📟 *Payment Details:*\n{summary}", parse_mode="Markdown")
-
-        # ✅ Send invite link if not already sent
-        if not has_user_been_invited(user_id):
-            try:
-                invite_link = await context.bot.create_chat_invite_link(
-                    chat_id=CHANNEL_ID,
-                    member_limit=1
-                )
-                await update.message.reply_text(
-                    f"📩 Here is your exclusive access link (valid for 24 hours):\n"
-                    f"{invite_link.invite_link}\n\n"
-                    "⚠️ This link can only be used once. Don't share it with others."
-                )
-                mark_user_as_invited(user_id)
-            except Exception as e:
-                logger.error(f"Failed to create invite link: {e}")
-                await update.message.reply_text(
-                    "✅ Payment verified but failed to generate access link.\n\n"
-                    "Please contact support with your transaction number."
-                )
-
-        # ✅ Notify admin
-        await context.bot.send_message(
-            chat_id=ADMIN_CHANNEL_ID,
-            text=(
-                f" *New Payment Confirmed!*\n\n"
-                f" *User:* `{user.full_name}` (`{user_id}`)\n"
-                f" *File:* `{filename}`\n"
-                f" *Amount:* `{extracted_fields['amount']}`\n"
-                f" *Time:* `{extracted_fields['time']}`\n"
-                f" *Transaction No:* `{transaction_no}`\n"
-                f" *Notes:* `{extracted_fields['notes'] or 'N/A'}`\n"
-                f" *Invite Sent:* `{has_user_been_invited(user_id)}`"
-            ),
-            parse_mode="Markdown"
-        )
+        await announce_payment(context.bot, update.effective_chat.id, user, payment, committed)
 
     except Exception as e:
         logger.error(f"[ERROR] {e}")
@@ -474,14 +989,42 @@ async def handle_payment_image(update: Update, context: ContextTypes.DEFAULT_TYP
         )
 
     finally:
-        if os.path.exists(filename):
+        if image_data is None and os.path.exists(filename):
             os.remove(filename)
 
     return ConversationHandler.END
 
+# -------------------- Lifecycle --------------------
+background_tasks = []
+
+async def post_init(app):
+    pending_payments.open()
+    await archiver.start()
+    if transaction_filter is not None:
+        background_tasks.append(app.create_task(load_transaction_filter()))
+    background_tasks.append(app.create_task(pending_payments_loop(app.bot)))
+
+async def post_shutdown(app):
+    for task in background_tasks:
+        task.cancel()
+    ocr_executor.shutdown()
+    await archiver.close()
+    await write_behind.close()
+    io_pool.shutdown()
+    logger.info(f"[CACHE] user status {user_status.stats()}")
+    logger.info(f"[CACHE] receipts {receipt_cache.stats()}")
+    logger.info(f"[QUEUE] {verification_queue.shed} verifications turned away")
+
 # -------------------- Bot Entry --------------------
 if __name__ == '__main__':
-    app = ApplicationBuilder().token(creds.BOT_TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(creds.BOT_TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("pay", pay))
@@ -497,4 +1040,4 @@ if __name__ == '__main__':
 
     app.add_handler(conv_handler)
     logger.info("💬 merxylab_bot is running...")
-    app.run_polling()
+    webhook_server.run(app)
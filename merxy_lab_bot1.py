@@ -9,7 +9,8 @@ from telegram.ext import (
 )
 from PIL import Image
 import pytesseract
-import boto3
+import aws_clients
+import webhook_server
 import os
 import creds
 import re
@@ -24,16 +25,8 @@ else:
     pytesseract.pytesseract.tesseract_cmd = "tesseract"
 
 
-# -------------------- AWS DynamoDB Setup --------------------
-dynamodb = boto3.resource(
-    'dynamodb',
-    aws_access_key_id=creds.AWS_ACCESS_KEY,
-    aws_secret_access_key=creds.AWS_SECRET_KEY,
-    region_name=creds.REGION_NAME
-)
-
 def log_payment_to_dynamodb(user_id, file_name, extracted_data: dict):
-    table = dynamodb.Table('merxylab-payment')
+    table = aws_clients.table('merxylab-payment')
     item = {
         "user_id": str(user_id),
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -43,17 +36,17 @@ def log_payment_to_dynamodb(user_id, file_name, extracted_data: dict):
     table.put_item(Item=item)
 
 def mark_user_as_invited(user_id):
-    table = dynamodb.Table('merxylab-invited_users')
+    table = aws_clients.table('merxylab-invited_users')
     table.put_item(Item={"user_id": str(user_id), "invited": True})
 
 def has_user_been_invited(user_id):
-    table = dynamodb.Table('merxylab-invited_users')
+    table = aws_clients.table('merxylab-invited_users')
     response = table.get_item(Key={"user_id": str(user_id)})
     return response.get("Item", {}).get("invited", False)
 
 def is_duplicate_transaction(transaction_no: str) -> bool:
     """Uses scan() to check for duplicates (no GSI required)."""
-    table = dynamodb.Table('merxylab-payment')
+    table = aws_clients.table('merxylab-payment')
     try:
         response = table.scan(
             FilterExpression=Attr('Transaction No').eq(transaction_no)
@@ -64,7 +57,7 @@ def is_duplicate_transaction(transaction_no: str) -> bool:
         return False
 
 def mark_user_as_started(user_id):
-    table = dynamodb.Table('merxylab-startedusers')
+    table = aws_clients.table('merxylab-startedusers')
     table.put_item(Item={
         "user_id": str(user_id),
         "has_started": True,
@@ -72,12 +65,12 @@ def mark_user_as_started(user_id):
     })
 
 def has_user_started(user_id):
-    table = dynamodb.Table('merxylab-startedusers')
+    table = aws_clients.table('merxylab-startedusers')
     response = table.get_item(Key={"user_id": str(user_id)})
     return response.get("Item", {}).get("has_started", False)
 
 def mark_user_as_paid(user_id, transaction_no):
-    table = dynamodb.Table('merxylab-paid_users')
+    table = aws_clients.table('merxylab-paid_users')
     table.put_item(Item={
         "user_id": str(user_id),
         "has_paid": True,
@@ -86,17 +79,12 @@ def mark_user_as_paid(user_id, transaction_no):
     })
 
 def has_user_paid(user_id):
-    table = dynamodb.Table('merxylab-paid_users')
+    table = aws_clients.table('merxylab-paid_users')
     response = table.get_item(Key={"user_id": str(user_id)})
     return response.get("Item", {}).get("has_paid", False)
 
 # -------------------- AWS S3 Setup --------------------
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=creds.AWS_ACCESS_KEY,
-    aws_secret_access_key=creds.AWS_SECRET_KEY,
-    region_name=creds.REGION_NAME
-)
+s3 = aws_clients.s3_client()
 
 
 
@@ -295,4 +283,4 @@ if __name__ == '__main__':
 
     app.add_handler(conv_handler)
     print("💬 merxylab_bot is running...")
-    app.run_polling()
+    webhook_server.run(app)
@@ -9,7 +9,8 @@ from telegram.ext import (
 )
 from PIL import Image
 import pytesseract
-import boto3
+import aws_clients
+import webhook_server
 import os
 import creds
 import re
@@ -27,18 +28,7 @@ else:
     pytesseract.pytesseract.tesseract_cmd = "tesseract"
 
 # -------------------- AWS Setup --------------------
-dynamodb = boto3.resource(
-    'dynamodb',
-    aws_access_key_id=creds.AWS_ACCESS_KEY,
-    aws_secret_access_key=creds.AWS_SECRET_KEY,
-    region_name=creds.REGION_NAME
-)
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=creds.AWS_ACCESS_KEY,
-    aws_secret_access_key=creds.AWS_SECRET_KEY,
-    region_name=creds.REGION_NAME
-)
+s3 = aws_clients.s3_client()
 
 # -------------------- Telegram States --------------------
 AWAITING_IMAGE = 1
@@ -47,7 +37,7 @@ ADMIN_CHANNEL_ID = creds.ADMIN_CHANNEL_ID
 
 # -------------------- DB Helpers --------------------
 def log_payment_to_dynamodb(user_id, file_name, extracted_data: dict):
-    table = dynamodb.Table('merxylab-payment')
+    table = aws_clients.table('merxylab-payment')
     item = {
         "user_id": str(user_id),
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -57,16 +47,16 @@ def log_payment_to_dynamodb(user_id, file_name, extracted_data: dict):
     table.put_item(Item=item)
 
 def mark_user_as_invited(user_id):
-    table = dynamodb.Table('merxylab-invited_users')
+    table = aws_clients.table('merxylab-invited_users')
     table.put_item(Item={"user_id": str(user_id), "invited": True})
 
 def has_user_been_invited(user_id):
-    table = dynamodb.Table('merxylab-invited_users')
+    table = aws_clients.table('merxylab-invited_users')
     response = table.get_item(Key={"user_id": str(user_id)})
     return response.get("Item", {}).get("invited", False)
 
 def is_duplicate_transaction(transaction_no: str) -> bool:
-    table = dynamodb.Table('merxylab-payment')
+    table = aws_clients.table('merxylab-payment')
     try:
         response = table.scan(
             FilterExpression=Attr('Transaction No').eq(transaction_no)
@@ -77,7 +67,7 @@ def is_duplicate_transaction(transaction_no: str) -> bool:
         return False
 
 def mark_user_as_started(user_id):
-    table = dynamodb.Table('merxylab-startedusers')
+    table = aws_clients.table('merxylab-startedusers')
     table.put_item(Item={
         "user_id": str(user_id),
         "has_started": True,
@@ -85,12 +75,12 @@ def mark_user_as_started(user_id):
     })
 
 def has_user_started(user_id):
-    table = dynamodb.Table('merxylab-startedusers')
+    table = aws_clients.table('merxylab-startedusers')
     response = table.get_item(Key={"user_id": str(user_id)})
     return response.get("Item", {}).get("has_started", False)
 
 def mark_user_as_paid(user, transaction_no):
-    table = dynamodb.Table('merxylab-paid_users')
+    table = aws_clients.table('merxylab-paid_users')
     table.put_item(Item={
         "user_id": str(user.id),
         "name": user.full_name,
@@ -101,7 +91,7 @@ def mark_user_as_paid(user, transaction_no):
     })
 
 def has_user_paid(user_id):
-    table = dynamodb.Table('merxylab-paid_users')
+    table = aws_clients.table('merxylab-paid_users')
     response = table.get_item(Key={"user_id": str(user_id)})
     return response.get("Item", {}).get("has_paid", False)
 
@@ -331,4 +321,4 @@ if __name__ == '__main__':
 
     app.add_handler(conv_handler)
     logger.info("💬 merxylab_bot is running...")
-    app.run_polling()
\ No newline at end of file
+    webhook_server.run(app)
\ No newline at end of file
@@ -9,7 +9,8 @@ from telegram.ext import (
 )
 from PIL import Image
 import pytesseract
-import boto3
+import aws_clients
+import webhook_server
 import os
 import creds
 import re
@@ -17,6 +18,7 @@ from datetime import datetime, timezone
 from boto3.dynamodb.conditions import Key, Attr
 import platform
 import logging
+from receipt_fields import extract_fields
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
@@ -27,18 +29,7 @@ else:
     pytesseract.pytesseract.tesseract_cmd = "tesseract"
 
 # -------------------- AWS Setup --------------------
-dynamodb = boto3.resource(
-    'dynamodb',
-    aws_access_key_id=creds.AWS_ACCESS_KEY,
-    aws_secret_access_key=creds.AWS_SECRET_KEY,
-    region_name=creds.REGION_NAME
-)
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=creds.AWS_ACCESS_KEY,
-    aws_secret_access_key=creds.AWS_SECRET_KEY,
-    region_name=creds.REGION_NAME
-)
+s3 = aws_clients.s3_client()
 
 # -------------------- Telegram States --------------------
 AWAITING_IMAGE = 1
@@ -47,7 +38,7 @@ ADMIN_CHANNEL_ID = creds.ADMIN_CHANNEL_ID
 
 # -------------------- DB Helpers --------------------
 def log_payment_to_dynamodb(user_id, username, file_name, extracted_data: dict):
-    table = dynamodb.Table('merxylab-payment')
+    table = aws_clients.table('merxylab-payment')
     item = {
         "user_id": str(user_id),
         "username": username or "N/A",
@@ -62,16 +53,16 @@ def log_payment_to_dynamodb(user_id, username, file_name, extracted_data: dict):
 
 
 def mark_user_as_invited(user_id):
-    table = dynamodb.Table('merxylab-invited_users')
+    table = aws_clients.table('merxylab-invited_users')
     table.put_item(Item={"user_id": str(user_id), "invited": True})
 
 def has_user_been_invited(user_id):
-    table = dynamodb.Table('merxylab-invited_users')
+    table = aws_clients.table('merxylab-invited_users')
     response = table.get_item(Key={"user_id": str(user_id)})
     return response.get("Item", {}).get("invited", False)
 
 def is_duplicate_transaction(transaction_no: str) -> bool:
-    table = dynamodb.Table('merxylab-payment')
+    table = aws_clients.table('merxylab-payment')
     try:
         response = table.scan(
             FilterExpression=Attr('transaction_no').eq(transaction_no)
@@ -82,7 +73,7 @@ def is_duplicate_transaction(transaction_no: str) -> bool:
         return False
 
 def mark_user_as_started(user_id):
-    table = dynamodb.Table('merxylab-startedusers')
+    table = aws_clients.table('merxylab-startedusers')
     table.put_item(Item={
         "user_id": str(user_id),
         "has_started": True,
@@ -90,12 +81,12 @@ def mark_user_as_started(user_id):
     })
 
 def has_user_started(user_id):
-    table = dynamodb.Table('merxylab-startedusers')
+    table = aws_clients.table('merxylab-startedusers')
     response = table.get_item(Key={"user_id": str(user_id)})
     return response.get("Item", {}).get("has_started", False)
 
 def mark_user_as_paid(user, transaction_no):
-    table = dynamodb.Table('merxylab-paid_users')
+    table = aws_clients.table('merxylab-paid_users')
     table.put_item(Item={
         "user_id": str(user.id),
         "name": user.full_name,
@@ -106,7 +97,7 @@ def mark_user_as_paid(user, transaction_no):
     })
 
 def has_user_paid(user_id):
-    table = dynamodb.Table('merxylab-paid_users')
+    table = aws_clients.table('merxylab-paid_users')
     response = table.get_item(Key={"user_id": str(user_id)})
     return response.get("Item", {}).get("has_paid", False)
 
@@ -222,98 +213,6 @@ def extract_text_from_image(image_path):
     return text
 
 
-def extract_fields(text):
-    result = {
-        "time": None,
-        "transaction_id": None,
-        "amount": None,
-        "name": None,
-        "notes": None
-    }
-
-    text = re.sub(r'\s+', ' ', text).strip()
-
-    # English format
-    eng_time = re.search(r'Transaction Time\s*([\d/]+ [\d:]+)', text)
-    eng_id = re.search(r'Transaction No\.?\s*(\d{16,20})', text)
-    eng_amount = re.search(r'Amount\s*(-?\d[\d,]*\.?\d*)\s*Ks', text)
-
-    if eng_time or eng_id or eng_amount:
-        if eng_time:
-            result["time"] = eng_time.group(1)
-        if eng_id:
-            result["transaction_id"] = eng_id.group(1)
-        if eng_amount:
-            amount = eng_amount.group(1).replace(',', '')
-            result["amount"] = f"{amount} Ks"
-
-        name_match = re.search(r'Transfer To\s*([A-Z][A-Za-z\s]+)\s*[\(<]?[*#]+(\d{4})[\)>]?', text)
-        if not name_match:
-            name_match = re.search(r'Transfer To\s*([A-Z][A-Za-z\s]+)\s*[*#]+\d{4}', text)
-        if name_match:
-            result["name"] = f"{name_match.group(1).strip()} ({name_match.group(2) if len(name_match.groups()) > 1 else name_match.group(1).split()[-1]})"
-
-        notes_match = re.search(r'Notes\s*([^\n]+?)(?=\s*(?:Transaction|Transfer|Amount|$))', text)
-        if notes_match:
-            result["notes"] = notes_match.group(1).strip()
-        else:
-            amount_pos = text.find('Amount') if 'Amount' in text else -1
-            if amount_pos > -1:
-                notes_part = text[amount_pos:].split('Ks')[-1].strip()
-                if notes_part and not any(x in notes_part for x in ['Transaction', 'Transfer']):
-                    result["notes"] = notes_part.split('\n')[0].strip()
-
-        return result
-
-    # Myanmar fallback
-    my_time = re.search(r'(\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2})', text)
-    my_id = re.search(r'(\d{16,20})', text)
-    my_amount = re.search(r'(-?\d[\d,]*\.?\d*)\s*Ks', text)
-
-    if my_time or my_id or my_amount:
-        if my_time:
-            result["time"] = my_time.group(1)
-        if my_id:
-            result["transaction_id"] = my_id.group(1)
-        if my_amount:
-            amount = my_amount.group(1).replace(',', '')
-            result["amount"] = f"{amount} Ks"
-
-        name_match = re.search(r'([A-Z][A-Za-z\s]+)\s*[\(<]?[*#]+(\d{4})[\)>]?', text)
-        if not name_match:
-            name_match = re.search(r'([A-Z][A-Za-z\s]+)\s*[*#]+\d{4}', text)
-        if name_match:
-            result["name"] = f"{name_match.group(1).strip()} ({name_match.group(2) if len(name_match.groups()) > 1 else name_match.group(1).split()[-1]})"
-
-        amount_pos = text.find('Ks') if 'Ks' in text else -1
-        if amount_pos > -1:
-            notes_part = text[amount_pos+2:].strip()
-            if notes_part and not any(x in notes_part for x in ['Transaction', 'Transfer']):
-                result["notes"] = notes_part.split('\n')[0].strip()
-
-        return result
-
-    # Fallback
-    time_match = re.search(r'(\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2})', text)
-    id_match = re.search(r'(\d{16,20})', text)
-    amount_match = re.search(r'(-?\d[\d,]*\.?\d*)\s*Ks', text)
-
-    if time_match:
-        result["time"] = time_match.group(1)
-    if id_match:
-        result["transaction_id"] = id_match.group(1)
-    if amount_match:
-        amount = amount_match.group(1).replace(',', '')
-        result["amount"] = f"{amount} Ks"
-
-    name_match = re.search(r'([A-Z][A-Za-z\s]+)\s*[\(<]?[*#]+(\d{4})[\)>]?', text)
-    if not name_match:
-        name_match = re.search(r'([A-Z][A-Za-z\s]+)\s*[*#]+\d{4}', text)
-    if name_match:
-        result["name"] = f"{name_match.group(1).strip()} ({name_match.group(2) if len(name_match.groups()) > 1 else name_match.group(1).split()[-1]})"
-
-    return result
-
 # -------------------- Image Handler --------------------
 async def handle_payment_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -489,4 +388,4 @@ if __name__ == '__main__':
 
     app.add_handler(conv_handler)
     logger.info("💬 merxylab_bot is running...")
-    app.run_polling()
+    webhook_server.run(app)
@@ -0,0 +1,49 @@
+"""Copy every transaction number already in merxylab-payment into the
+merxylab-transactions table used by the duplicate check.
+
+    python migrate_transactions.py
+
+Safe to re-run: numbers that are already reserved are left untouched.
+"""
+import aws_clients
+from botocore.exceptions import ClientError
+
+
+def scan_payments():
+    table = aws_clients.table('merxylab-payment')
+    kwargs = {"ProjectionExpression": "transaction_no, user_id, #ts",
+              "ExpressionAttributeNames": {"#ts": "timestamp"}}
+    while True:
+        response = table.scan(**kwargs)
+        yield from response.get("Items", [])
+        if "LastEvaluatedKey" not in response:
+            return
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def main():
+    table = aws_clients.table('merxylab-transactions')
+    copied = skipped = 0
+    for payment in scan_payments():
+        transaction_no = payment.get("transaction_no")
+        if not transaction_no:
+            continue
+        try:
+            table.put_item(
+                Item={
+                    "transaction_no": transaction_no,
+                    "user_id": payment.get("user_id", ""),
+                    "timestamp": payment.get("timestamp", ""),
+                },
+                ConditionExpression="attribute_not_exists(transaction_no)",
+            )
+            copied += 1
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            skipped += 1
+    print(f"Reserved {copied} transaction numbers ({skipped} already present)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+import logging
+import threading
+
+import pytesseract
+
+logger = logging.getLogger(__name__)
+
+
+# Page segmentation modes for reading a cropped field.
+PSM_SINGLE_BLOCK = 6
+PSM_SINGLE_LINE = 7
+
+
+def parse_tsv(tsv):
+    """Word rows of Tesseract's TSV output as dicts.
+
+    Each word has its text, confidence (0-100), bounding box and the
+    block/paragraph/line numbers that place it on the page.
+    """
+    words = []
+    for row in tsv.splitlines():
+        cols = row.split("\t")
+        if len(cols) < 12 or cols[0] != "5" or not cols[11].strip():
+            continue
+        words.append({
+            "text": cols[11].strip(),
+            "conf": float(cols[10]),
+            "left": int(cols[6]),
+            "top": int(cols[7]),
+            "width": int(cols[8]),
+            "height": int(cols[9]),
+            "line": (int(cols[2]), int(cols[3]), int(cols[4])),
+        })
+    return words
+
+
+class OCRBackend:
+    name = "base"
+
+    def image_to_string(self, image, lang="eng", psm=None, whitelist=None):
+        raise NotImplementedError
+
+    def image_to_data(self, image, lang="eng"):
+        """Words with confidences and boxes, see ``parse_tsv``."""
+        raise NotImplementedError
+
+    def languages(self):
+        """Languages with installed traineddata."""
+        raise NotImplementedError
+
+    def usable_lang(self, lang, fallback="eng"):
+        """``lang`` without the parts whose traineddata is missing.
+
+        "eng+mya" on a host without mya.traineddata gives "eng", so English
+        receipts can still be read there.
+        """
+        parts = lang.split("+")
+        try:
+            available = set(self.languages())
+        except Exception as e:
+            logger.warning(f"Could not list Tesseract languages ({e}), using '{lang}'")
+            return lang
+        usable = [part for part in parts if part in available]
+        if len(usable) < len(parts):
+            missing = "+".join(part for part in parts if part not in available)
+            logger.warning(f"No traineddata for '{missing}', reading receipts with '{'+'.join(usable) or fallback}'")
+        return "+".join(usable) or fallback
+
+    def warm_up(self, langs):
+        pass
+
+    def close(self):
+        pass
+
+
+class PytesseractBackend(OCRBackend):
+    """Shells out to the ``tesseract`` binary once per call."""
+
+    name = "pytesseract"
+
+    @staticmethod
+    def _config(psm, whitelist):
+        config = []
+        if psm is not None:
+            config.append(f"--psm {psm}")
+        if whitelist:
+            config.append(f"-c tessedit_char_whitelist={whitelist.replace(' ', '')}")
+        return " ".join(config)
+
+    def image_to_string(self, image, lang="eng", psm=None, whitelist=None):
+        return pytesseract.image_to_string(image, lang=lang, config=self._config(psm, whitelist))
+
+    def image_to_data(self, image, lang="eng"):
+        return parse_tsv(pytesseract.image_to_data(image, lang=lang))
+
+    def languages(self):
+        return pytesseract.get_languages()
+
+
+class TesserocrBackend(OCRBackend):
+    """Keeps one Tesseract API handle per language loaded for the life of the
+    process, so neither the binary nor the traineddata is reloaded per call.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, tessdata_path=None):
+        import tesserocr
+
+        self._tesserocr = tesserocr
+        self._tessdata_path = tessdata_path
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def _engine(self, lang):
+        with self._lock:
+            engine = self._engines.get(lang)
+            if engine is None:
+                kwargs = {"lang": lang}
+                if self._tessdata_path:
+                    kwargs["path"] = self._tessdata_path
+                engine = (self._tesserocr.PyTessBaseAPI(**kwargs), threading.Lock())
+                self._engines[lang] = engine
+                logger.info(f"Loaded Tesseract engine for '{lang}'")
+            return engine
+
+    def _set_image(self, api, image):
+        api.SetImage(image)
+        dpi = image.info.get("dpi")
+        if dpi:
+            api.SetSourceResolution(int(dpi[0]))
+
+    def image_to_string(self, image, lang="eng", psm=None, whitelist=None):
+        api, lock = self._engine(lang)
+        with lock:
+            default_psm = api.GetPageSegMode()
+            if psm is not None:
+                api.SetPageSegMode(psm)
+            if whitelist:
+                api.SetVariable("tessedit_char_whitelist", whitelist)
+            try:
+                self._set_image(api, image)
+                return api.GetUTF8Text()
+            finally:
+                # The handle is shared by later calls, so undo per-call settings.
+                api.SetPageSegMode(default_psm)
+                if whitelist:
+                    api.SetVariable("tessedit_char_whitelist", "")
+                api.Clear()
+
+    def image_to_data(self, image, lang="eng"):
+        api, lock = self._engine(lang)
+        with lock:
+            self._set_image(api, image)
+            try:
+                api.Recognize()
+                return parse_tsv(api.GetTSVText(0))
+            finally:
+                api.Clear()
+
+    def languages(self):
+        if self._tessdata_path:
+            return self._tesserocr.get_languages(self._tessdata_path)[1]
+        return self._tesserocr.get_languages()[1]
+
+    def warm_up(self, langs):
+        for lang in langs:
+            self._engine(lang)
+
+    def close(self):
+        with self._lock:
+            for api, _ in self._engines.values():
+                api.End()
+            self._engines.clear()
+
+
+_backend = None
+
+
+def create_backend(name="auto", tessdata_path=None):
+    if name == "pytesseract":
+        return PytesseractBackend()
+    if name == "tesserocr":
+        # Asked for by name: a missing tesserocr is a setup error.
+        return TesserocrBackend(tessdata_path)
+    if name != "auto":
+        raise ValueError(f"Unknown OCR backend: {name}")
+    try:
+        return TesserocrBackend(tessdata_path)
+    except Exception as e:
+        # tesserocr needs the libtesseract headers at install time, so it is
+        # optional; pytesseract only needs the binary on PATH.
+        logger.warning(f"tesserocr unavailable ({e}), falling back to pytesseract")
+        return PytesseractBackend()
+
+
+def get_backend(name="auto", tessdata_path=None):
+    """Return this process's backend, creating it on first use."""
+    global _backend
+    if _backend is None:
+        _backend = create_backend(name, tessdata_path)
+    return _backend
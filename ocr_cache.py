@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ReceiptCache:
+    """OCR results keyed by a hash of the receipt image bytes.
+
+    The memory tier is an LRU bounded by the encoded size of its entries.
+    When ``disk_dir`` is set every entry is also written there as JSON, so
+    results survive a restart and are promoted back into memory on a hit.
+    The disk tier holds at most ``disk_max_bytes``; past that the least
+    recently used files (by mtime) are removed until a quarter is free.
+    ``get`` and ``put`` are awaited on the event loop, which answers from
+    memory; the disk tier is read and written through ``run`` (e.g.
+    ``AWSExecutor.run``).
+    """
+
+    def __init__(self, run, max_bytes=32 * 1024 * 1024, disk_dir=None,
+                 disk_max_bytes=256 * 1024 * 1024, namespace=""):
+        self.run = run
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._disk_size = None
+        self._disk_lock = threading.Lock()
+
+    def key_for(self, data) -> str:
+        # The namespace changes with OCR settings, so toggling them does not
+        # serve results produced by the old pipeline.
+        digest = hashlib.sha256(self.namespace.encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    async def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry)
+        value = None
+        if self.disk_dir:
+            value = await self.run(self._read_disk, key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, json.dumps(value))
+        return value
+
+    async def put(self, key, value):
+        encoded = json.dumps(value)
+        self._remember(key, encoded)
+        if self.disk_dir:
+            await self.run(self._write_disk, key, encoded)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "disk_bytes": self._disk_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _remember(self, key, encoded):
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = encoded
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # recently used: evicted last
+            return value
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"[CACHE] Unreadable entry {key}: {e}")
+            return None
+
+    def _write_disk(self, key, encoded):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(encoded)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"[CACHE] Could not persist entry {key}: {e}")
+            return
+        with self._disk_lock:
+            if self._disk_size is None:
+                # First write since start: size up what earlier runs left.
+                self._disk_size = sum(size for _, size, _ in self._disk_files())
+            else:
+                self._disk_size += len(encoded)
+            if self._disk_size > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _disk_files(self):
+        """(mtime, size, path) of every entry on disk."""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _evict_disk(self):
+        # Recount from the directory, which also corrects overwrites that
+        # were counted twice, then drop the oldest down to 3/4 of the budget.
+        files = sorted(self._disk_files())
+        size = sum(file_size for _, file_size, _ in files)
+        target = self.disk_max_bytes * 3 // 4
+        removed = 0
+        for _, file_size, path in files:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"[CACHE] Could not evict {path}: {e}")
+                continue
+            size -= file_size
+            removed += 1
+        self._disk_size = size
+        logger.info(f"[CACHE] Evicted {removed} entries from {self.disk_dir}, {size} bytes left")
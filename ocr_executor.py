@@ -0,0 +1,131 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+class OCRTimeout(Exception):
+    """Raised when a job does not finish within its timeout."""
+
+
+class OCRExecutor:
+    """Runs blocking OCR jobs in a process pool so the event loop stays free.
+
+    It does not bound its own backlog: callers admit jobs through a
+    verification_queue.VerificationQueue sized to ``max_workers`` and pass
+    the slot's release as ``on_done``, so a worker still busy with a
+    timed-out job keeps its slot.
+    """
+
+    def __init__(self, max_workers=None, timeout=60.0, initializer=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.initializer = initializer
+        self._pool = None
+        self._pending = 0
+        self._loop = None
+        self._closed = False
+
+    def _ensure_started(self):
+        # Created lazily so importing the bot module (e.g. in a spawned
+        # worker) never starts a second pool.
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=self.initializer,
+            )
+
+    @property
+    def pending(self):
+        """Jobs submitted whose worker has not returned yet, timed out or not."""
+        return self._pending
+
+    def _job_done(self, on_done, future):
+        # Runs in the pool's management thread.
+        try:
+            self._loop.call_soon_threadsafe(self._release, on_done)
+        except RuntimeError:
+            pass  # the loop is already closed
+
+    def _release(self, on_done):
+        self._pending -= 1
+        if on_done is not None:
+            on_done()
+
+    async def run(self, fn, *args, timeout=None, on_done=None):
+        """Run ``fn(*args)`` in a worker, giving up after ``timeout`` seconds.
+
+        A job that times out after it started cannot be stopped: it keeps
+        its worker, and counts towards ``pending``, until Tesseract returns.
+        ``on_done()`` is called on the event loop once the worker is free
+        again, whether the job finished, failed, timed out or never ran.
+        """
+        try:
+            if self._closed:
+                raise RuntimeError("OCR executor is shut down")
+            if timeout is None:
+                timeout = self.timeout
+            if timeout <= 0:
+                raise ValueError(f"OCR timeout must be positive, got {timeout}")
+            self._ensure_started()
+
+            self._loop = asyncio.get_running_loop()
+            pool = self._pool
+            job = pool.submit(fn, *args)
+        except BaseException as e:
+            if on_done is not None:
+                on_done()
+            if isinstance(e, BrokenProcessPool):
+                self._discard_broken(pool, e)
+            raise
+        self._pending += 1
+        job.add_done_callback(functools.partial(self._job_done, on_done))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(job), timeout)
+        except asyncio.TimeoutError:
+            # A job still waiting in the pool is dropped by the cancel.
+            if job.running():
+                logger.warning(f"[OCR] Timed-out job keeps its worker busy ({self._pending} pending)")
+            raise OCRTimeout(f"OCR job exceeded {timeout:.0f}s")
+        except BrokenProcessPool as e:
+            self._discard_broken(pool, e)
+            raise
+
+    def _discard_broken(self, pool, error):
+        # A worker died (OOM killer, a crash in the OCR engine) or the
+        # initializer raised: the pool refuses all work from now on, so the
+        # next job starts a new one. Jobs still in flight fail with it.
+        if self._pool is not pool:
+            return  # already replaced by another job that saw it break
+        logger.error(f"[OCR] Worker pool broke, starting a new one for the next job: {error}")
+        self._stop_pool(wait=False)
+
+    def _stop_pool(self, wait, timeout=None):
+        pool, self._pool = self._pool, None
+        # ProcessPoolExecutor.shutdown(wait=True) waits for ever on a worker
+        # stuck in Tesseract, so the workers are joined here, with a limit,
+        # and whatever is still running afterwards is terminated.
+        processes = list((pool._processes or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        if not wait:
+            return
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+        stuck = [process for process in processes if process.is_alive()]
+        for process in stuck:
+            process.terminate()
+        if stuck:
+            logger.warning(f"[OCR] Terminated {len(stuck)} worker(s) still running after {timeout:.0f}s")
+
+    def shutdown(self, wait=True, timeout=10.0):
+        """Stop the pool, waiting at most ``timeout`` seconds for workers."""
+        self._closed = True
+        if self._pool is not None:
+            logger.info("Shutting down OCR executor")
+            self._stop_pool(wait, timeout)
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import random
+import shutil
+import uuid
+from urllib.parse import quote, unquote
+
+from PIL import Image, features
+
+logger = logging.getLogger(__name__)
+
+_EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+CONTENT_TYPES = {"webp": "image/webp", "jpg": "image/jpeg", "png": "image/png"}
+
+
+def transcode_receipt(data, fmt="WEBP", quality=80, max_side=2000):
+    """Re-encode a receipt for archival: (bytes, format).
+
+    The image is scaled down so its longer side is at most ``max_side`` and
+    encoded as WebP (or JPEG when Pillow has no WebP support) at
+    ``quality``. Screenshots are mostly flat colour, so this is usually a
+    fraction of the PNG or high-quality JPEG Telegram hands us.
+    """
+    if fmt == "WEBP" and not features.check("webp"):
+        fmt = "JPEG"
+    image = Image.open(io.BytesIO(memoryview(data)))
+    image = image.convert("RGB")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    out = io.BytesIO()
+    if fmt == "WEBP":
+        image.save(out, "WEBP", quality=quality, method=4)
+    else:
+        image.save(out, "JPEG", quality=quality, optimize=True)
+    return out.getvalue(), fmt
+
+
+def content_key(data, fmt, prefix="payments/"):
+    """Content-addressed object key: identical images share one object."""
+    return f"{prefix}{hashlib.sha256(data).hexdigest()}.{_EXTENSIONS[fmt]}"
+
+
+def content_type_for(key):
+    return CONTENT_TYPES.get(key.rsplit(".", 1)[-1].lower())
+
+
+class ReceiptArchiver:
+    """Uploads receipt images in the background from a local spool.
+
+    ``stage`` writes the image to ``spool_dir`` before the payment is
+    committed and returns its spool entry; ``submit`` queues the entry once
+    the commit succeeded and ``discard`` drops it otherwise. Every payment
+    gets its own entry, even when two of them share a content-addressed
+    key, so one payment's discard never takes another's receipt; the
+    second upload of the same key is skipped by ``upload`` itself.
+    ``workers`` uploads run at a time through ``upload`` (an
+    ``async def upload(path, key)``); a failed one is retried with
+    exponential backoff up to ``max_delay`` seconds, and the spool file is
+    removed only after a successful upload. On ``start`` every file still
+    in the spool (from a crash or a shutdown) is queued again, so no
+    committed receipt is lost; uploading an uncommitted leftover is
+    harmless.
+    """
+
+    def __init__(self, spool_dir, upload, workers=4, base_delay=1.0, max_delay=300.0):
+        self.spool_dir = spool_dir
+        self.upload = upload
+        self.workers = workers
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.uploaded = 0
+        self._queue = asyncio.Queue()
+        self._attempts = {}
+        self._tasks = []
+
+    def __len__(self):
+        return len(os.listdir(self.spool_dir))
+
+    def _path(self, entry):
+        return os.path.join(self.spool_dir, entry)
+
+    @staticmethod
+    def _key(entry):
+        return unquote(entry.split("_", 1)[1])
+
+    def stage(self, source, key):
+        """Durably keep a receipt from bytes or a file path (which is moved).
+
+        Returns the spool entry to ``submit`` or ``discard``.
+        """
+        entry = f"{uuid.uuid4().hex}_{quote(key, safe='')}"
+        path = self._path(entry)
+        if isinstance(source, (bytes, bytearray)):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(source)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        else:
+            shutil.move(source, path)
+        return entry
+
+    def is_staged(self, entry):
+        return os.path.exists(self._path(entry))
+
+    def submit(self, entry):
+        self._queue.put_nowait(entry)
+
+    def discard(self, entry):
+        try:
+            os.remove(self._path(entry))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"[ARCHIVE] Could not remove {entry} from the spool: {e}")
+
+    async def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        for name in sorted(os.listdir(self.spool_dir)):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.spool_dir, name))
+            else:
+                self.submit(name)
+        if self._queue.qsize():
+            logger.info(f"[ARCHIVE] Re-queued {self._queue.qsize()} receipts from {self.spool_dir}")
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self):
+        while True:
+            entry = await self._queue.get()
+            path = self._path(entry)
+            key = self._key(entry)
+            if not os.path.exists(path):
+                logger.error(f"[ARCHIVE] {key} was submitted but {path} is gone; not uploaded")
+                continue
+            try:
+                await self.upload(path, key)
+            except Exception as e:
+                attempts = self._attempts[entry] = self._attempts.get(entry, 0) + 1
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning(f"[ARCHIVE] Upload {attempts} of {key} failed, retrying in {delay:.0f}s: {e}")
+                asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, entry)
+                continue
+            self._attempts.pop(entry, None)
+            self.uploaded += 1
+            self.discard(entry)
+
+    async def close(self):
+        """Stop uploading; whatever is left stays in the spool for next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,138 @@
+import re
+
+# Every label in one scan. "Transaction" / "Transfer" on their own only mark
+# where a Notes value ends.
+_LABELS = re.compile(
+    r"Transaction Time|Transaction No\.?|Transfer To|Amount|Transaction|Transfer"
+)
+# Found on its own: "Transaction Notes" would otherwise be read as the
+# "Transaction No" label and hide it.
+_NOTES_LABEL = re.compile(r"Notes")
+# Free-standing values, for receipts whose labels are not in English. These
+# can overlap (an id followed by "Ks" is also an amount), so each keeps its
+# own leftmost search rather than sharing one alternation.
+_TIME = re.compile(r"\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}")
+_ID = re.compile(r"\d{16,20}")
+_AMOUNT = re.compile(r"(-?\d[\d,]*\.?\d*)\s*Ks")
+
+# Values read directly after a label (anchored with .match, so they only
+# look at the few characters that follow it).
+_TIME_AFTER_LABEL = re.compile(r"\s*([\d/]+ [\d:]+)")
+_ID_AFTER_LABEL = re.compile(r"\s*(\d{16,20})")
+_AMOUNT_AFTER_LABEL = re.compile(r"\s*(-?\d[\d,]*\.?\d*)\s*Ks")
+_NAME_AFTER_LABEL = re.compile(r"\s*([A-Z][A-Za-z\s]+)\s*[\(<]?[*#]+(\d{4})[\)>]?")
+# Receipts without English labels: the masked account is found on its own.
+_NAME = re.compile(r"([A-Z][A-Za-z\s]+)\s*[\(<]?[*#]+(\d{4})[\)>]?")
+
+_LABELLED = {
+    "Transaction Time": ("time", _TIME_AFTER_LABEL),
+    "Transaction No": ("transaction_id", _ID_AFTER_LABEL),
+    "Transaction No.": ("transaction_id", _ID_AFTER_LABEL),
+    "Amount": ("amount", _AMOUNT_AFTER_LABEL),
+    "Transfer To": ("name", _NAME_AFTER_LABEL),
+}
+_NOTES_STOPS = ("Transaction", "Transfer", "Amount")
+
+
+def _format_amount(raw):
+    return f"{raw.replace(',', '')} Ks"
+
+
+def _format_name(match):
+    return f"{match.group(1).strip()} ({match.group(2)})"
+
+
+def _labelled_values(text, labels):
+    matches = {}
+    for label in labels:
+        spec = _LABELLED.get(label.group())
+        if spec is None:
+            continue
+        key, pattern = spec
+        if key not in matches:
+            match = pattern.match(text, label.end())
+            if match:
+                matches[key] = match
+    return matches
+
+
+def _notes_after_label(text, labels, label_end):
+    # The value starts at the first non-space character after "Notes" and
+    # runs up to the next Transaction/Transfer/Amount label or the end.
+    value_start = label_end
+    while value_start < len(text) and text[value_start] == " ":
+        value_start += 1
+    if value_start >= len(text):
+        return None
+    value_end = len(text)
+    for label in labels:
+        if label.start() > value_start and label.group().startswith(_NOTES_STOPS):
+            value_end = label.start()
+            break
+    return text[value_start:value_end].strip()
+
+
+def extract_fields(text):
+    result = {
+        "time": None,
+        "transaction_id": None,
+        "amount": None,
+        "name": None,
+        "notes": None
+    }
+
+    # Same as collapsing \s+ to one space and stripping, without the regex.
+    text = ' '.join(text.split())
+    labels = list(_LABELS.finditer(text))
+
+    # English format: at least one value sits right after its label
+    matches = _labelled_values(text, labels)
+    if "time" in matches or "transaction_id" in matches or "amount" in matches:
+        if "time" in matches:
+            result["time"] = matches["time"].group(1)
+        if "transaction_id" in matches:
+            result["transaction_id"] = matches["transaction_id"].group(1)
+        if "amount" in matches:
+            result["amount"] = _format_amount(matches["amount"].group(1))
+        if "name" in matches:
+            result["name"] = _format_name(matches["name"])
+
+        for notes_label in _NOTES_LABEL.finditer(text):
+            notes = _notes_after_label(text, labels, notes_label.end())
+            if notes is not None:
+                result["notes"] = notes
+                break
+        else:
+            amount_pos = text.find('Amount')
+            if amount_pos > -1:
+                notes_part = text[amount_pos:].split('Ks')[-1].strip()
+                if notes_part and 'Transaction' not in notes_part and 'Transfer' not in notes_part:
+                    result["notes"] = notes_part
+
+        return result
+
+    time_match = _TIME.search(text)
+    id_match = _ID.search(text)
+    amount_match = _AMOUNT.search(text)
+    if time_match:
+        result["time"] = time_match.group()
+    if id_match:
+        result["transaction_id"] = id_match.group()
+    if amount_match:
+        result["amount"] = _format_amount(amount_match.group(1))
+
+    # The masked account number needs a '*' or '#'; without one the
+    # backtracking name search cannot match, so skip it.
+    name_match = _NAME.search(text) if ('*' in text or '#' in text) else None
+    if name_match:
+        result["name"] = _format_name(name_match)
+
+    # Myanmar fallback: whatever follows the first "Ks" is the note
+    if time_match or id_match or amount_match:
+        amount_pos = text.find('Ks')
+        if amount_pos > -1:
+            notes_part = text[amount_pos + 2:].strip()
+            if notes_part and 'Transaction' not in notes_part and 'Transfer' not in notes_part:
+                result["notes"] = notes_part
+
+    return result
@@ -0,0 +1,180 @@
+import re
+
+from PIL import Image
+
+from ocr_backends import PSM_SINGLE_BLOCK, PSM_SINGLE_LINE
+from receipt_locale import has_myanmar_script, normalize_myanmar
+
+# Label words as they appear on an English KBZPay receipt, per field.
+LABELS = {
+    "time": ("transaction", "time"),
+    "transaction_id": ("transaction", "no"),
+    "amount": ("amount",),
+    "name": ("transfer", "to"),
+    "notes": ("notes",),
+}
+
+# Words below this confidence get their field re-read from a crop.
+MIN_CONFIDENCE = 70
+
+_TIME = re.compile(r"\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}")
+_ID = re.compile(r"\d{16,20}")
+_AMOUNT = re.compile(r"(-?\d[\d,]*\.?\d*)\s*Ks")
+_NAME = re.compile(r"([A-Z][A-Za-z\s]+)\s*[\(<]?[*#]+(\d{4})[\)>]?")
+
+# How each field is re-read when the first pass was not confident:
+# (character whitelist, language, page segmentation). Digits are always
+# Latin after normalization, so numeric fields are re-read with "eng" and a
+# whitelist; Notes are re-read with the single model matching their script.
+# The name may span the name row and the masked-account row below it.
+_REREAD = {
+    "time": ("0123456789/:", "eng", PSM_SINGLE_LINE),
+    "transaction_id": ("0123456789", "eng", PSM_SINGLE_LINE),
+    "amount": ("0123456789,.-Ks", "eng", PSM_SINGLE_LINE),
+    "name": (None, "eng", PSM_SINGLE_BLOCK),
+    "notes": (None, None, PSM_SINGLE_LINE),
+}
+
+
+def parse_value(field, text):
+    """Normalize a raw value into what extract_fields returns, or None."""
+    if field == "time":
+        match = _TIME.search(text)
+        return match.group() if match else None
+    if field == "transaction_id":
+        # Tesseract sometimes splits a long number into several words.
+        match = _ID.search(text.replace(" ", ""))
+        return match.group() if match else None
+    if field == "amount":
+        match = _AMOUNT.search(text)
+        return f"{match.group(1).replace(',', '')} Ks" if match else None
+    if field == "name":
+        match = _NAME.search(text)
+        return f"{match.group(1).strip()} ({match.group(2)})" if match else None
+    return text.strip() or None
+
+
+def group_rows(words):
+    """Group words into visual rows by vertical overlap, top to bottom.
+
+    Tesseract often puts a left-aligned label and its right-aligned value in
+    different blocks, so its own line numbers cannot be used to pair them.
+    """
+    rows = []
+    for word in sorted(words, key=lambda w: (w["top"], w["left"])):
+        center = word["top"] + word["height"] / 2
+        for row in rows:
+            if abs(center - row["center"]) < max(row["height"], word["height"]) / 2:
+                row["words"].append(word)
+                break
+        else:
+            rows.append({"center": center, "height": word["height"], "words": [word]})
+    for row in rows:
+        row["words"].sort(key=lambda w: w["left"])
+    return rows
+
+
+def rows_to_text(rows):
+    return "\n".join(" ".join(w["text"] for w in row["words"]) for row in rows)
+
+
+def _normalize(word):
+    return word.lower().strip(".:")
+
+
+def _find_label(rows, label):
+    """(row index, index of the first word after the label) or None."""
+    for row_index, row in enumerate(rows):
+        # A normalized Burmese label is one word holding several tokens.
+        tokens, owners = [], []
+        for word_index, word in enumerate(row["words"]):
+            for token in word["text"].split():
+                tokens.append(_normalize(token))
+                owners.append(word_index)
+        for start in range(len(tokens) - len(label) + 1):
+            if tuple(tokens[start:start + len(label)]) == label:
+                return row_index, owners[start + len(label) - 1] + 1
+    return None
+
+
+def _box(words):
+    left = min(w["left"] for w in words)
+    top = min(w["top"] for w in words)
+    right = max(w["left"] + w["width"] for w in words)
+    bottom = max(w["top"] + w["height"] for w in words)
+    return left, top, right, bottom
+
+
+def locate_fields(rows):
+    """Find the value words for every labelled field.
+
+    The value is whatever follows the label on its row; when the row ends at
+    the label, the next row is used. The masked account of "Transfer To"
+    may wrap onto the row below the name, so that row is added as well.
+    """
+    label_positions = {
+        field: position
+        for field, label in LABELS.items()
+        if (position := _find_label(rows, label)) is not None
+    }
+    label_rows = {row_index for row_index, _ in label_positions.values()}
+
+    located = {}
+    for field, (row_index, after) in label_positions.items():
+        words = rows[row_index]["words"][after:]
+        next_row = row_index + 1
+        if not words and next_row < len(rows) and next_row not in label_rows:
+            words = rows[next_row]["words"]
+            next_row += 1
+        if field == "name" and next_row < len(rows) and next_row not in label_rows:
+            if not _NAME.search(" ".join(w["text"] for w in words)):
+                words = words + rows[next_row]["words"]
+        if words:
+            located[field] = {
+                "text": " ".join(w["text"] for w in words),
+                "conf": min(w["conf"] for w in words),
+                "box": _box(words),
+            }
+    return located
+
+
+def _crop(image, box, pad=6):
+    left, top, right, bottom = box
+    crop = image.crop((
+        max(0, left - pad), max(0, top - pad),
+        min(image.width, right + pad), min(image.height, bottom + pad),
+    ))
+    # Single-line recognition is most reliable with ~30px+ glyphs.
+    if crop.height < 48:
+        factor = 48 / crop.height
+        crop = crop.resize((round(crop.width * factor), 48), Image.BICUBIC)
+    return crop
+
+
+def read_fields(image, rows, backend, min_confidence=MIN_CONFIDENCE):
+    """Fields read geometrically from the word rows of ``group_rows``.
+
+    Returns (fields, rereads): ``fields`` has the keys of extract_fields with
+    None for anything not found; ``rereads`` counts the crops that were sent
+    back to Tesseract because the first read was unsure or malformed.
+    """
+    located = locate_fields(rows)
+    fields = dict.fromkeys(LABELS)
+    rereads = 0
+    for field, value in located.items():
+        parsed = parse_value(field, value["text"])
+        if parsed is not None and value["conf"] >= min_confidence:
+            fields[field] = parsed
+            continue
+        whitelist, lang, psm = _REREAD[field]
+        if lang is None:
+            lang = "mya" if has_myanmar_script(value["text"]) else "eng"
+        rereads += 1
+        text = backend.image_to_string(
+            _crop(image, value["box"]),
+            lang=lang,
+            psm=psm,
+            whitelist=whitelist,
+        )
+        fields[field] = parse_value(field, normalize_myanmar(text)) or parsed
+    return fields, rereads
@@ -0,0 +1,44 @@
+import re
+
+_MYANMAR_SCRIPT = re.compile(r"[က-႟]")
+_MYANMAR_DIGITS = str.maketrans("၀၁၂၃၄၅၆၇၈၉", "0123456789")
+
+# Burmese-locale KBZPay labels and units, mapped to the English forms
+# extract_fields looks for. Longer labels first so a label that contains a
+# shorter one (ငွေပမာဏ / ပမာဏ) is replaced as a whole.
+MYANMAR_LABELS = [
+    ("လုပ်ဆောင်ချက်အမျိုးအစား", "Transaction Type"),
+    ("လုပ်ဆောင်ချက်အချိန်", "Transaction Time"),
+    ("လုပ်ဆောင်ချက်အမှတ်", "Transaction No"),
+    ("ငွေလွှဲသည့်အချိန်", "Transaction Time"),
+    ("ငွေလွှဲအမှတ်", "Transaction No"),
+    ("လွှဲပို့သည့်အကောင့်", "Transfer To"),
+    ("ငွေလက်ခံသူ", "Transfer To"),
+    ("ငွေပမာဏ", "Amount"),
+    ("ပမာဏ", "Amount"),
+    ("မှတ်ချက်", "Notes"),
+    ("ကျပ်", "Ks"),
+]
+_LABEL_PATTERN = re.compile("|".join(re.escape(label) for label, _ in MYANMAR_LABELS))
+_LABEL_MAP = dict(MYANMAR_LABELS)
+
+
+def has_myanmar_script(text) -> bool:
+    return _MYANMAR_SCRIPT.search(text) is not None
+
+
+def detect_locale(text) -> str:
+    """'mya' when most letters on the receipt are Burmese, else 'eng'."""
+    burmese = len(_MYANMAR_SCRIPT.findall(text))
+    latin = sum(1 for ch in text if "a" <= ch.lower() <= "z")
+    return "mya" if burmese > latin else "eng"
+
+
+def normalize_myanmar(text) -> str:
+    """Myanmar digits to ASCII and localized labels to their English form."""
+    if not has_myanmar_script(text):
+        return text
+    text = text.translate(_MYANMAR_DIGITS)
+    # Burmese is written without spaces; pad so "ငွေပမာဏ5,000" becomes
+    # "Amount 5,000" rather than "Amount5,000".
+    return _LABEL_PATTERN.sub(lambda m: f" {_LABEL_MAP[m.group()]} ", text)
@@ -0,0 +1,178 @@
+import io
+import json
+import logging
+import os
+import sys
+import threading
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# A 16x16 difference hash (256 bits). KBZPay receipts share one layout, and
+# even at this size different receipts often land within a few bits of each
+# other: a match is a hint to check, never proof of reuse on its own.
+HASH_SIZE = 16
+
+
+def dhash(image, hash_size=HASH_SIZE) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair."""
+    # For JPEGs, draft() lets the decoder scale down while decoding, which
+    # is far cheaper than decoding the full screenshot first.
+    image.draft("L", (hash_size * 8, hash_size * 8))
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def dhash_bytes(data) -> int:
+    return dhash(Image.open(io.BytesIO(data)))
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Metric tree over Hamming distance. A radius search only descends into
+    children whose edge distance lies within ``d ± radius`` of the query, so
+    it touches a small fraction of the nodes.
+    """
+
+    def __init__(self):
+        self._root = None
+        self.size = 0
+
+    def add(self, value: int, key: str):
+        self.size += 1
+        if self._root is None:
+            self._root = (value, [key], {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(key)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [key], {})
+                return
+            node = child
+
+    def search(self, value: int, radius: int):
+        """Return [(distance, key)] for every entry within ``radius``, nearest first."""
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                matches.extend((distance, key) for key in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return sorted(matches)
+
+
+class ReceiptHashIndex:
+    """Perceptual hashes of archived receipts, persisted as an append-only
+    JSON-lines file of ``{"key": <s3 key>, "hash": <hex>}`` records.
+    """
+
+    def __init__(self, path, max_distance=8):
+        self.path = path
+        self.max_distance = max_distance
+        self._tree = BKTree()
+        self._keys = set()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash mid-append leaves at most one torn line.
+                    continue
+                self._insert(int(record["hash"], 16), record["key"])
+        logger.info(f"[PHASH] Loaded {len(self._keys)} receipt hashes")
+
+    def _insert(self, value, key):
+        if key not in self._keys:
+            self._keys.add(key)
+            self._tree.add(value, key)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def find(self, value: int):
+        """Closest (distance, key) within max_distance, or None."""
+        with self._lock:
+            matches = self._tree.search(value, self.max_distance)
+        return matches[0] if matches else None
+
+    def add(self, value: int, key: str):
+        with self._lock:
+            if key in self._keys:
+                return
+            self._insert(value, key)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "hash": f"{value:x}"}) + "\n")
+
+
+def backfill(index, s3, bucket, prefix="payments/", workers=8):
+    """Hash every receipt already stored under ``prefix`` into ``index``."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def hash_object(key):
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+        return key, dhash_bytes(body)
+
+    keys = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []) if obj["Key"] not in index)
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(hash_object, key) for key in keys]:
+            try:
+                key, value = future.result()
+            except Exception as e:
+                logger.error(f"[PHASH] Skipping receipt: {e}")
+                continue
+            index.add(value, key)
+            done += 1
+            if done % 500 == 0:
+                print(f"{done}/{len(keys)} receipts hashed")
+    return done
+
+
+if __name__ == '__main__':
+    # python receipt_phash.py backfill
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python receipt_phash.py backfill")
+
+    import aws_clients
+    import creds
+
+    logging.basicConfig(level=logging.INFO)
+    s3 = aws_clients.s3_client()
+    index = ReceiptHashIndex(getattr(creds, "PHASH_INDEX_PATH", "receipt_phash.jsonl"))
+    added = backfill(index, s3, creds.BUCKET_NAME)
+    print(f"Indexed {added} new receipts ({len(index)} total)")
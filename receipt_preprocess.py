@@ -0,0 +1,122 @@
+from PIL import Image, ImageChops, ImageFilter, ImageOps
+
+# Width the layout analysis runs at; the crop box is scaled back up after.
+ANALYSIS_WIDTH = 480
+# Pixel height Tesseract reads most reliably for a line of text
+# (roughly 10-12pt at 300 DPI).
+TARGET_LINE_HEIGHT = 36
+TARGET_DPI = 300
+
+
+def to_grayscale(image):
+    gray = ImageOps.grayscale(image.convert("RGB"))
+    # Dark-mode screenshots: make the text dark on a light background.
+    if _background_level(gray) < 128:
+        gray = ImageOps.invert(gray)
+    return gray
+
+
+def _background_level(gray):
+    histogram = gray.histogram()
+    return histogram.index(max(histogram))
+
+
+def _row_profile(gray):
+    """Shrink the page and return (small image, fraction of ink per row)."""
+    scale = ANALYSIS_WIDTH / gray.width
+    small = gray.resize((ANALYSIS_WIDTH, max(1, round(gray.height * scale))), Image.BILINEAR)
+    background = _background_level(small)
+    ink = small.point(lambda v: 255 if abs(v - background) > 40 else 0)
+    # Box-resampling every row down to one pixel averages it in C.
+    rows = [v / 255 for v in ink.resize((1, ink.height), Image.BOX).getdata()]
+    return ink, rows
+
+
+def _text_lines(rows, start=0):
+    """Return (top, bottom) bands of consecutive rows that contain ink."""
+    lines, top = [], None
+    for y in range(start, len(rows)):
+        if 0 < rows[y] < 0.9:
+            if top is None:
+                top = y
+        elif top is not None:
+            lines.append((top, y))
+            top = None
+    if top is not None:
+        lines.append((top, len(rows)))
+    return lines
+
+
+def crop_details_region(gray, crop_box=None):
+    """Crop the receipt to the block holding the transaction details.
+
+    ``crop_box`` is an optional (left, top, right, bottom) tuple of fractions
+    for layouts that are known up front. Otherwise the status bar and the
+    solid app header are skipped and the page is cut down to the bounding
+    box of the remaining text.
+    """
+    if crop_box:
+        left, top, right, bottom = crop_box
+        return gray.crop((
+            round(left * gray.width), round(top * gray.height),
+            round(right * gray.width), round(bottom * gray.height),
+        ))
+
+    ink, rows = _row_profile(gray)
+    # The KBZPay header is a solid colour band near the top; anything at or
+    # above the last such band is chrome, not receipt content.
+    header_end = 0
+    for y in range(len(rows) // 4):
+        if rows[y] >= 0.9:
+            header_end = y + 1
+    lines = _text_lines(rows, header_end)
+    if not lines:
+        return gray
+
+    top, bottom = lines[0][0], lines[-1][1]
+    bbox = ink.crop((0, top, ink.width, bottom)).getbbox()
+    if bbox is None:
+        return gray
+    scale = gray.width / ink.width
+    margin = 4
+    return gray.crop((
+        max(0, round((bbox[0] - margin) * scale)),
+        max(0, round((top - margin) * scale)),
+        min(gray.width, round((bbox[2] + margin) * scale)),
+        min(gray.height, round((bottom + margin) * scale)),
+    ))
+
+
+def normalize_resolution(gray):
+    """Rescale so a typical text line is TARGET_LINE_HEIGHT pixels tall."""
+    _, rows = _row_profile(gray)
+    heights = sorted(bottom - top for top, bottom in _text_lines(rows) if bottom - top > 1)
+    if not heights:
+        return gray
+    line_height = heights[len(heights) // 2] * gray.width / ANALYSIS_WIDTH
+    factor = min(2.0, max(0.25, TARGET_LINE_HEIGHT / line_height))
+    if abs(factor - 1.0) > 0.1:
+        gray = gray.resize(
+            (round(gray.width * factor), round(gray.height * factor)),
+            Image.LANCZOS if factor < 1 else Image.BICUBIC,
+        )
+    return gray
+
+
+def binarize_adaptive(gray, radius=15, offset=12):
+    """Local-mean threshold: a pixel is ink when it is ``offset`` levels
+    darker than the mean of its neighbourhood. Copes with the gradients and
+    tinted cards that a single global threshold turns into noise.
+    """
+    local_mean = gray.filter(ImageFilter.BoxBlur(radius))
+    darker = ImageChops.subtract(local_mean, gray)
+    return darker.point(lambda v: 0 if v > offset else 255)
+
+
+def preprocess_receipt(image, crop_box=None):
+    gray = to_grayscale(image)
+    gray = crop_details_region(gray, crop_box)
+    gray = normalize_resolution(gray)
+    binary = binarize_adaptive(gray)
+    binary.info["dpi"] = (TARGET_DPI, TARGET_DPI)
+    return binary
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class DependencyUnavailable(Exception):
+    """A storage call failed, timed out or was refused by its breaker."""
+
+
+class CircuitOpen(DependencyUnavailable):
+    """Raised without calling the dependency while its breaker is open."""
+
+
+class DeadlineExceeded(DependencyUnavailable):
+    """Raised when a call does not finish within its share of the budget."""
+
+
+class CircuitBreaker:
+    """Stops calling a dependency after ``failure_threshold`` failures in a row.
+
+    While open every call fails fast with ``CircuitOpen``. After
+    ``reset_timeout`` seconds one trial call is let through (half-open): a
+    success closes the breaker, a failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self._state()
+            if state == "open" or (state == "half-open" and self._trial_running):
+                raise CircuitOpen(f"{self.name} circuit is open")
+            if state == "half-open":
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.warning(f"[BREAKER] {self.name} closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_cancelled(self):
+        # A cancelled half-open trial says nothing; let the next call try.
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"[BREAKER] {self.name} opened after {self._failures} failures")
+                self._opened_at = self._clock()
+
+
+class Deadline:
+    """What is left of an overall latency budget, handed out per call."""
+
+    def __init__(self, budget, clock=time.monotonic):
+        self._clock = clock
+        self.expires = clock() + budget
+
+    def remaining(self):
+        return self.expires - self._clock()
+
+    def timeout(self, cap=None):
+        """Seconds the next call may take: the rest of the budget, at most ``cap``."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Latency budget used up")
+        return remaining if cap is None else min(remaining, cap)
+
+
+async def guarded_call(breaker, run, fn, *args, deadline=None, timeout=None):
+    """``await run(fn, *args)`` through ``breaker`` within the deadline.
+
+    Any failure is reported to the breaker and raised as
+    ``DependencyUnavailable`` (the original error is its ``__cause__``).
+    """
+    # Before before_call: a spent budget must not leave a half-open trial
+    # marked as running with no outcome ever recorded.
+    limit = deadline.timeout(timeout) if deadline is not None else timeout
+    breaker.before_call()
+    try:
+        result = await asyncio.wait_for(run(fn, *args), limit)
+    except asyncio.CancelledError:
+        breaker.record_cancelled()
+        raise
+    except asyncio.TimeoutError:
+        breaker.record_failure()
+        raise DeadlineExceeded(f"{breaker.name} call exceeded {limit:.1f}s")
+    except Exception as e:
+        breaker.record_failure()
+        raise DependencyUnavailable(f"{breaker.name}: {e}") from e
+    breaker.record_success()
+    return result
+
+
+async def hedged_call(breaker, run, fn, *args, hedge_after=0.1, deadline=None, timeout=None):
+    """A read sent a second time if the first has not answered in ``hedge_after``.
+
+    Whichever copy answers first wins. Only for idempotent reads: a slow
+    replica or a dropped connection then costs ``hedge_after`` rather than
+    the full timeout.
+    """
+    first = asyncio.ensure_future(guarded_call(breaker, run, fn, *args, deadline=deadline, timeout=timeout))
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done:
+        return first.result()
+    second = asyncio.ensure_future(guarded_call(breaker, run, fn, *args, deadline=deadline, timeout=timeout))
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class CommitSpool:
+    """Verified payments waiting to be committed while storage is down.
+
+    Each entry is ``<id>.json`` plus the receipt image as ``<id>.img`` in
+    ``directory``, written atomically, so a restart keeps them. Entries are
+    only removed once they have been committed or rejected; one that
+    cannot be processed is moved to ``failed/`` by ``quarantine``. ``open``
+    creates the directories.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def open(self):
+        os.makedirs(os.path.join(self.directory, "failed"), exist_ok=True)
+
+    def __len__(self):
+        return len(self.ids())
+
+    def _path(self, entry_id, suffix):
+        return os.path.join(self.directory, f"{entry_id}{suffix}")
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def add(self, record, image_bytes):
+        entry_id = f"{time.time_ns()}_{uuid.uuid4().hex[:8]}"
+        # Image first: a .json without its .img is never visible.
+        self._write(self._path(entry_id, ".img"), bytes(image_bytes))
+        self._write(self._path(entry_id, ".json"), json.dumps(record).encode())
+        return entry_id
+
+    def ids(self):
+        """Entry ids, oldest first."""
+        return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def load(self, entry_id):
+        with open(self._path(entry_id, ".json"), encoding="utf-8") as f:
+            record = json.load(f)
+        with open(self._path(entry_id, ".img"), "rb") as f:
+            return record, f.read()
+
+    def quarantine(self, entry_id):
+        """Set an entry aside in ``failed/`` so it is not retried again."""
+        for suffix in (".img", ".json"):
+            name = f"{entry_id}{suffix}"
+            try:
+                os.replace(self._path(entry_id, suffix), os.path.join(self.directory, "failed", name))
+            except FileNotFoundError:
+                pass
+
+    def remove(self, entry_id):
+        for suffix in (".json", ".img"):
+            try:
+                os.remove(self._path(entry_id, suffix))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,360 @@
+import io
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+# Logical record kinds used by the bot. Items are plain dicts with the same
+# attribute names in every backend.
+STARTED = "started"
+PAID = "paid"
+INVITED = "invited"
+PAYMENTS = "payments"
+TRANSACTIONS = "transactions"
+
+
+class Storage:
+    """What the bot needs from a database and a receipt store.
+
+    All methods are blocking; the bot runs them on its I/O thread pool.
+    """
+
+    def put_item(self, kind, item):
+        raise NotImplementedError
+
+    def put_items(self, kind, items):
+        for item in items:
+            self.put_item(kind, item)
+
+    def get_user_state(self, user_id) -> dict:
+        """{"started", "paid", "invited", "last_transaction_no"} in one read."""
+        raise NotImplementedError
+
+    def is_duplicate_transaction(self, transaction_no) -> bool:
+        raise NotImplementedError
+
+    def transaction_owner(self, transaction_no):
+        """user_id that reserved the transaction number, or None."""
+        raise NotImplementedError
+
+    def commit_payment(self, payment, paid_user) -> bool:
+        """Store the payment, reserve its transaction number and mark the
+        user as paid, all or nothing. False if the number was already used."""
+        raise NotImplementedError
+
+    def transaction_numbers(self, segment=0, total_segments=1):
+        """Every reserved transaction number in one segment of the table."""
+        raise NotImplementedError
+
+    def has_receipt(self, key) -> bool:
+        raise NotImplementedError
+
+    def put_receipt(self, source, key, content_type=None):
+        """Store a receipt image from a file path or from bytes."""
+        raise NotImplementedError
+
+
+def _reservation(payment):
+    return {
+        "transaction_no": payment["transaction_no"],
+        "user_id": payment["user_id"],
+        "timestamp": payment["timestamp"],
+    }
+
+
+class DynamoDBStorage(Storage):
+    """The merxylab-* DynamoDB tables and the receipts S3 bucket.
+
+    Table handles and clients come from ``aws`` (an ``AWSExecutor``), which
+    keeps them per worker thread.
+    """
+
+    TABLES = {
+        STARTED: "merxylab-startedusers",
+        PAID: "merxylab-paid_users",
+        INVITED: "merxylab-invited_users",
+        PAYMENTS: "merxylab-payment",
+        TRANSACTIONS: "merxylab-transactions",
+    }
+    # Where each user flag lives: kind -> attribute.
+    FLAGS = {STARTED: "has_started", PAID: "has_paid", INVITED: "invited"}
+
+    def __init__(self, aws, bucket):
+        self.aws = aws
+        self.bucket = bucket
+
+    def put_item(self, kind, item):
+        self.aws.table(self.TABLES[kind]).put_item(Item=item)
+
+    def put_items(self, kind, items):
+        # batch_writer resends unprocessed items itself.
+        with self.aws.table(self.TABLES[kind]).batch_writer(overwrite_by_pkeys=["user_id"]) as batch:
+            for item in items:
+                batch.put_item(Item=item)
+
+    def get_user_state(self, user_id):
+        # One BatchGetItem across the three user tables instead of a
+        # get_item per table. merxylab-paid_users keeps the number of the
+        # user's latest payment, so merxylab-payment is not read.
+        key = {"user_id": str(user_id)}
+        request = {self.TABLES[kind]: {"Keys": [key]} for kind in self.FLAGS}
+        items = {}
+        for attempt in range(5):
+            response = self.aws.dynamodb().batch_get_item(RequestItems=request)
+            for table, found in response.get("Responses", {}).items():
+                if found:
+                    items[table] = found[0]
+            request = response.get("UnprocessedKeys")
+            if not request:
+                break
+            # Throttled keys come back unprocessed; retry just those.
+            time.sleep(0.05 * 2 ** attempt)
+        else:
+            raise RuntimeError(f"User state for {user_id} still unprocessed after retries")
+
+        state = {
+            kind: items.get(self.TABLES[kind], {}).get(attribute, False)
+            for kind, attribute in self.FLAGS.items()
+        }
+        state["last_transaction_no"] = items.get(self.TABLES[PAID], {}).get("transaction_no")
+        return state
+
+    def is_duplicate_transaction(self, transaction_no):
+        table = self.aws.table(self.TABLES[TRANSACTIONS])
+        response = table.get_item(Key={"transaction_no": transaction_no}, ConsistentRead=True)
+        return "Item" in response
+
+    def transaction_owner(self, transaction_no):
+        table = self.aws.table(self.TABLES[TRANSACTIONS])
+        response = table.get_item(Key={"transaction_no": transaction_no}, ConsistentRead=True)
+        return response.get("Item", {}).get("user_id")
+
+    def commit_payment(self, payment, paid_user):
+        from botocore.exceptions import ClientError
+
+        try:
+            # The resource's client converts plain Python values to attribute values.
+            self.aws.dynamodb().meta.client.transact_write_items(TransactItems=[
+                {"Put": {"TableName": self.TABLES[PAYMENTS], "Item": payment}},
+                {"Put": {
+                    "TableName": self.TABLES[TRANSACTIONS],
+                    "Item": _reservation(payment),
+                    "ConditionExpression": "attribute_not_exists(transaction_no)",
+                }},
+                {"Put": {"TableName": self.TABLES[PAID], "Item": paid_user}},
+            ])
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            reasons = e.response.get("CancellationReasons", [])
+            if len(reasons) > 1 and reasons[1].get("Code") == "ConditionalCheckFailed":
+                return False
+            raise
+
+    def transaction_numbers(self, segment=0, total_segments=1):
+        table = self.aws.table(self.TABLES[TRANSACTIONS])
+        kwargs = {
+            "ProjectionExpression": "transaction_no",
+            "Segment": segment,
+            "TotalSegments": total_segments,
+        }
+        while True:
+            response = table.scan(**kwargs)
+            for item in response.get("Items", []):
+                yield item["transaction_no"]
+            if "LastEvaluatedKey" not in response:
+                return
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def has_receipt(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.aws.s3().head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put_receipt(self, source, key, content_type=None):
+        extra_args = {"ContentType": content_type} if content_type else None
+        if isinstance(source, (bytes, bytearray)):
+            self.aws.s3().upload_fileobj(io.BytesIO(source), self.bucket, key, ExtraArgs=extra_args)
+        else:
+            self.aws.s3().upload_file(source, self.bucket, key, ExtraArgs=extra_args)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS started_users (
+    user_id TEXT PRIMARY KEY,
+    has_started INTEGER NOT NULL,
+    timestamp TEXT
+);
+CREATE TABLE IF NOT EXISTS paid_users (
+    user_id TEXT PRIMARY KEY,
+    name TEXT,
+    username TEXT,
+    has_paid INTEGER NOT NULL,
+    payment_time TEXT,
+    transaction_no TEXT
+);
+CREATE TABLE IF NOT EXISTS invited_users (
+    user_id TEXT PRIMARY KEY,
+    invited INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    username TEXT,
+    timestamp TEXT,
+    file_name TEXT,
+    s3_key TEXT,
+    transaction_no TEXT,
+    amount TEXT,
+    transaction_time TEXT,
+    notes TEXT
+);
+CREATE INDEX IF NOT EXISTS payments_user_id ON payments (user_id);
+CREATE INDEX IF NOT EXISTS payments_transaction_no ON payments (transaction_no);
+CREATE TABLE IF NOT EXISTS transactions (
+    transaction_no TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    timestamp TEXT
+) WITHOUT ROWID;
+"""
+
+# kind -> (table, columns). Statements are built once from these, so every
+# call reuses a prepared statement from the connection's cache.
+_SQLITE_TABLES = {
+    STARTED: ("started_users", ("user_id", "has_started", "timestamp")),
+    PAID: ("paid_users", ("user_id", "name", "username", "has_paid", "payment_time", "transaction_no")),
+    INVITED: ("invited_users", ("user_id", "invited")),
+    PAYMENTS: ("payments", (
+        "user_id", "username", "timestamp", "file_name", "s3_key", "transaction_no",
+        "amount", "transaction_time", "notes",
+    )),
+    TRANSACTIONS: ("transactions", ("transaction_no", "user_id", "timestamp")),
+}
+_INSERT = {
+    kind: (
+        f"INSERT {'' if kind == PAYMENTS else 'OR REPLACE '}INTO {table} "
+        f"({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        columns,
+    )
+    for kind, (table, columns) in _SQLITE_TABLES.items()
+}
+_USER_STATE = """
+SELECT
+    (SELECT has_started FROM started_users WHERE user_id = :user_id),
+    (SELECT has_paid FROM paid_users WHERE user_id = :user_id),
+    (SELECT invited FROM invited_users WHERE user_id = :user_id),
+    (SELECT transaction_no FROM paid_users WHERE user_id = :user_id)
+"""
+_RESERVE = "INSERT INTO transactions (transaction_no, user_id, timestamp) VALUES (?, ?, ?)"
+
+
+class SQLiteStorage(Storage):
+    """A single SQLite file (WAL mode) plus a directory of receipt images.
+
+    For single-host deployments and offline benchmarks: lookups are local
+    index reads. Every thread gets its own connection; WAL lets readers run
+    while a payment is being committed.
+    """
+
+    def __init__(self, path="merxylab.db", receipts_dir="receipts"):
+        self.path = path
+        self.receipts_dir = receipts_dir
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    columns = {row[1] for row in conn.execute("PRAGMA table_info(payments)")}
+                    if "s3_key" not in columns:
+                        conn.execute("ALTER TABLE payments ADD COLUMN s3_key TEXT")
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(kind, item):
+        sql, columns = _INSERT[kind]
+        return sql, [item.get(column) for column in columns]
+
+    def put_item(self, kind, item):
+        sql, values = self._row(kind, item)
+        with self._connection() as conn:
+            conn.execute(sql, values)
+
+    def put_items(self, kind, items):
+        sql, columns = _INSERT[kind]
+        with self._connection() as conn:
+            conn.executemany(sql, ([item.get(column) for column in columns] for item in items))
+
+    def get_user_state(self, user_id):
+        started, paid, invited, last_transaction_no = self._connection().execute(
+            _USER_STATE, {"user_id": str(user_id)}
+        ).fetchone()
+        return {
+            STARTED: bool(started),
+            PAID: bool(paid),
+            INVITED: bool(invited),
+            "last_transaction_no": last_transaction_no,
+        }
+
+    def is_duplicate_transaction(self, transaction_no):
+        row = self._connection().execute(
+            "SELECT 1 FROM transactions WHERE transaction_no = ?", (transaction_no,)
+        ).fetchone()
+        return row is not None
+
+    def transaction_owner(self, transaction_no):
+        row = self._connection().execute(
+            "SELECT user_id FROM transactions WHERE transaction_no = ?", (transaction_no,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def commit_payment(self, payment, paid_user):
+        reservation = _reservation(payment)
+        with self._connection() as conn:
+            try:
+                conn.execute(_RESERVE, [reservation[c] for c in _SQLITE_TABLES[TRANSACTIONS][1]])
+            except sqlite3.IntegrityError:
+                # transaction_no is the primary key: the number is taken.
+                return False
+            conn.execute(*self._row(PAYMENTS, payment))
+            conn.execute(*self._row(PAID, paid_user))
+        return True
+
+    def transaction_numbers(self, segment=0, total_segments=1):
+        # A local read is fast enough in one pass; other segments are empty.
+        if segment != 0:
+            return
+        for (transaction_no,) in self._connection().execute("SELECT transaction_no FROM transactions"):
+            yield transaction_no
+
+    def _receipt_path(self, key):
+        return os.path.join(self.receipts_dir, *key.split("/"))
+
+    def has_receipt(self, key):
+        return os.path.exists(self._receipt_path(key))
+
+    def put_receipt(self, source, key, content_type=None):
+        path = self._receipt_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(source, (bytes, bytearray)):
+            with open(path, "wb") as f:
+                f.write(source)
+        else:
+            shutil.copyfile(source, path)
@@ -0,0 +1,51 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserStatusCache:
+    """Per-user flags (started / paid / invited) with a TTL and LRU bound.
+
+    Both answers are cached: ``False`` is kept for ``negative_ttl`` so a user
+    repeating /pay before paying does not hit DynamoDB either. The flags
+    only ever go from False to True, and every write in this process goes
+    through ``set``, so the TTL only matters for writes made elsewhere
+    (another bot instance, the console).
+    """
+
+    def __init__(self, max_entries=10000, ttl=600, negative_ttl=60, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kind, user_id, default=None):
+        key = (kind, str(user_id))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+        return default
+
+    def set(self, kind, user_id, value):
+        ttl = self.ttl if value else self.negative_ttl
+        key = (kind, str(user_id))
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, self._clock() + ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class VerificationQueueFull(Exception):
+    """Raised instead of queueing when ``max_depth`` jobs are already waiting."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Verification queue full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class RecentlyShed:
+    """Users turned away in the last ``ttl`` seconds, at most ``max_entries``."""
+
+    def __init__(self, ttl=600, max_entries=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._expiry = OrderedDict()
+
+    def add(self, user_id):
+        now = self._clock()
+        self._expiry.pop(user_id, None)
+        self._expiry[user_id] = now + self.ttl
+        # Insertion order is expiry order: drop from the front.
+        while self._expiry:
+            oldest, expires = next(iter(self._expiry.items()))
+            if expires > now and len(self._expiry) <= self.max_entries:
+                break
+            del self._expiry[oldest]
+
+    def pop(self, user_id):
+        """Whether ``user_id`` was turned away recently; forgets it either way."""
+        expires = self._expiry.pop(user_id, None)
+        return expires is not None and expires > self._clock()
+
+
+class _Waiter:
+    __slots__ = ("future", "on_position", "position", "notified_at", "timer")
+
+    def __init__(self, future, on_position):
+        self.future = future
+        self.on_position = on_position
+        self.position = None
+        self.notified_at = None
+        self.timer = None
+
+
+class VerificationQueue:
+    """Lets ``workers`` verifications run at a time, most urgent first.
+
+    ``release = await queue.acquire(priority, on_position)`` waits for a free
+    slot and ``release()`` gives it back once the job is really over, which
+    for an OCR job is when its worker returns, not when the caller stops
+    waiting. Lower ``priority`` values go first, ties in arrival order. At
+    most ``max_depth`` jobs wait; beyond that ``acquire`` raises
+    ``VerificationQueueFull`` with an estimate of when to try again, based
+    on how long recent jobs took. ``on_position`` (an ``async def (k)``) is
+    told the waiter's place in the queue whenever it changes, at most every
+    ``notify_interval`` seconds (a change inside that interval is sent when
+    it ends), and ``0`` once the job starts.
+    """
+
+    def __init__(self, workers, max_depth=32, notify_interval=3.0, job_seconds=10.0, clock=time.monotonic):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.notify_interval = notify_interval
+        self.shed = 0
+        self._job_seconds = job_seconds
+        self._clock = clock
+        self._active = 0
+        self._heap = []
+        self._seq = itertools.count()
+        self._notifications = set()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def retry_after(self):
+        """Seconds until a new job would likely get a slot, rounded up to 5."""
+        wait = self._job_seconds * (len(self._heap) + 1) / self.workers
+        return max(5, 5 * math.ceil(wait / 5))
+
+    async def acquire(self, priority=1, on_position=None):
+        """Wait for a slot; returns the function that gives it back (once)."""
+        await self._acquire(priority, on_position)
+        started = self._clock()
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            self._job_seconds = 0.8 * self._job_seconds + 0.2 * (self._clock() - started)
+            self._release()
+
+        return release
+
+    async def _acquire(self, priority, on_position):
+        if self._active < self.workers and not self._heap:
+            self._active += 1
+            return
+        if len(self._heap) >= self.max_depth:
+            self.shed += 1
+            raise VerificationQueueFull(self.retry_after())
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), on_position)
+        heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+        self._notify_positions()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted a slot just as we were cancelled: pass it on.
+                self._release()
+            else:
+                self._heap = [entry for entry in self._heap if entry[2] is not waiter]
+                heapq.heapify(self._heap)
+                self._notify_positions()
+            raise
+        finally:
+            if waiter.timer is not None:
+                waiter.timer.cancel()
+        self._notify(waiter, 0)
+
+    def _release(self):
+        # The slot goes straight to the next waiter, so _active stays put.
+        while self._heap:
+            waiter = heapq.heappop(self._heap)[2]
+            if not waiter.future.done():
+                waiter.future.set_result(None)
+                self._notify_positions()
+                return
+        self._active -= 1
+
+    def _notify_positions(self):
+        now = self._clock()
+        for position, (_, _, waiter) in enumerate(sorted(self._heap), start=1):
+            if waiter.position == position or waiter.on_position is None:
+                continue
+            if waiter.notified_at is not None and now - waiter.notified_at < self.notify_interval:
+                if waiter.timer is None:
+                    # Trailing update once the interval is over.
+                    delay = waiter.notified_at + self.notify_interval - now
+                    waiter.timer = asyncio.get_running_loop().call_later(delay, self._trailing_update, waiter)
+                continue
+            self._notify(waiter, position)
+
+    def _trailing_update(self, waiter):
+        waiter.timer = None
+        if not waiter.future.done():
+            self._notify_positions()
+
+    def _notify(self, waiter, position):
+        if waiter.on_position is None:
+            return
+        waiter.position = position
+        waiter.notified_at = self._clock()
+        task = asyncio.ensure_future(waiter.on_position(position))
+        self._notifications.add(task)
+        task.add_done_callback(self._notification_done)
+
+    def _notification_done(self, task):
+        self._notifications.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"[QUEUE] Position update failed: {task.exception()}")
@@ -0,0 +1,227 @@
+"""Serve a bot's Application over a webhook instead of long polling.
+
+``run(app)`` keeps ``app.run_polling()`` unless creds.BOT_MODE is
+"webhook"; then Telegram POSTs every update to an embedded starlette app
+run by uvicorn, and it reaches the handlers as soon as it arrives. Settings,
+from creds:
+
+    WEBHOOK_SECRET           secret token Telegram sends in
+                             X-Telegram-Bot-Api-Secret-Token (required)
+    WEBHOOK_URL              public base URL, e.g. https://bot.example.com;
+                             when unset the webhook is not registered
+    WEBHOOK_PATH             path updates are POSTed to ("/telegram")
+    WEBHOOK_HOST             listen address ("0.0.0.0")
+    WEBHOOK_PORT             listen port (8443)
+    WEBHOOK_CERT/WEBHOOK_KEY PEM certificate and key to serve TLS directly;
+                             the certificate is uploaded to Telegram too, so
+                             a self-signed one works
+    WEBHOOK_MAX_CONNECTIONS  concurrent deliveries Telegram may open (40)
+    WEBHOOK_PEERS            base URLs of every instance, as they reach each
+                             other, in the same order everywhere (unset: a
+                             single instance)
+    WEBHOOK_INSTANCE         this instance's index in WEBHOOK_PEERS
+    WEBHOOK_PEER_CA          CA bundle peers' certificates are checked
+                             against (default: WEBHOOK_CERT when set, so
+                             self-signed instances trust each other; the
+                             peer URLs must then match its name)
+
+GET /healthz answers while the process is up; GET /readyz only while the
+Application is running.
+
+Several instances: conversation state, per-user ordering and the
+in-process caches live in each process, so every user must always be
+handled by the same one. With WEBHOOK_PEERS set, an instance that gets an
+update for a user it does not own (user id modulo the number of peers)
+forwards it to the owner, so a load balancer may spread deliveries freely.
+Without WEBHOOK_PEERS, run exactly one instance; more than one is not
+supported.
+
+starlette and uvicorn are only needed in webhook mode:
+pip install -r requirements-webhook.txt
+
+Trying it locally without Telegram::
+
+    openssl req -x509 -newkey rsa:2048 -nodes -days 30 -subj /CN=localhost \\
+        -keyout webhook.key -out webhook.pem
+    # creds: BOT_MODE = "webhook", WEBHOOK_SECRET = "s3cret",
+    #        WEBHOOK_CERT = "webhook.pem", WEBHOOK_KEY = "webhook.key"
+    curl -k https://localhost:8443/readyz
+    curl -k -H "X-Telegram-Bot-Api-Secret-Token: s3cret" \\
+        -H "Content-Type: application/json" \\
+        -d '{"update_id": 1, "message": {...}}' https://localhost:8443/telegram
+"""
+import asyncio
+import hmac
+import json
+import logging
+import ssl
+
+from telegram import Update
+
+import creds
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+FORWARDED_HEADER = "X-Merxy-Forwarded"
+
+
+class PeerRouter:
+    """Pins every user to one of ``peers`` and forwards their updates there."""
+
+    def __init__(self, peers, instance, secret, path="/telegram", timeout=5.0, ca_file=None):
+        self.peers = [peer.rstrip("/") for peer in peers]
+        self.instance = instance
+        self.secret = secret
+        self.path = path
+        self.timeout = timeout
+        self.ca_file = ca_file
+        self._client = None
+
+    def owner(self, update):
+        """Index of the instance that handles ``update``."""
+        if update.effective_user is not None:
+            key = update.effective_user.id
+        elif update.effective_chat is not None:
+            key = update.effective_chat.id
+        else:
+            return self.instance
+        return key % len(self.peers)
+
+    async def forward(self, owner, body):
+        import httpx
+
+        if self._client is None:
+            verify = ssl.create_default_context(cafile=self.ca_file) if self.ca_file else True
+            self._client = httpx.AsyncClient(timeout=self.timeout, verify=verify)
+        response = await self._client.post(
+            f"{self.peers[owner]}{self.path}",
+            content=body,
+            headers={
+                SECRET_HEADER: self.secret,
+                FORWARDED_HEADER: "1",
+                "Content-Type": "application/json",
+            },
+        )
+        response.raise_for_status()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def run(app):
+    """Run ``app`` until stopped: polling, or a webhook server per creds."""
+    if getattr(creds, "BOT_MODE", "polling") != "webhook":
+        app.run_polling()
+        return
+    asyncio.run(serve(app))
+
+
+def build_web_app(app, secret, path="/telegram", router=None):
+    """The starlette app: webhook endpoint plus /healthz and /readyz."""
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse, Response
+    from starlette.routing import Route
+
+    async def telegram(request):
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), secret.encode()):
+            return Response(status_code=403)
+        body = await request.body()
+        try:
+            update = Update.de_json(json.loads(body), app.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            logger.warning(f"[WEBHOOK] Rejected malformed update: {e}")
+            return Response(status_code=400)
+        if router is not None and FORWARDED_HEADER not in request.headers:
+            owner = router.owner(update)
+            if owner != router.instance:
+                try:
+                    await router.forward(owner, body)
+                except Exception as e:
+                    # Telegram delivers the update again later.
+                    logger.warning(f"[WEBHOOK] Could not forward update to instance {owner}: {e}")
+                    return Response(status_code=503)
+                return Response()
+        await app.update_queue.put(update)
+        return Response()
+
+    async def healthz(request):
+        return PlainTextResponse("ok")
+
+    async def readyz(request):
+        if app.running:
+            return PlainTextResponse("ready")
+        return PlainTextResponse("not ready", status_code=503)
+
+    return Starlette(routes=[
+        Route(path, telegram, methods=["POST"]),
+        Route("/healthz", healthz, methods=["GET"]),
+        Route("/readyz", readyz, methods=["GET"]),
+    ])
+
+
+async def serve(app):
+    """Start ``app``, serve its webhook until uvicorn exits, then stop it.
+
+    run_polling() normally calls post_init and post_shutdown; here they are
+    called by hand around start and stop.
+    """
+    import uvicorn
+
+    secret = creds.WEBHOOK_SECRET
+    path = getattr(creds, "WEBHOOK_PATH", "/telegram")
+    cert = getattr(creds, "WEBHOOK_CERT", None)
+    key = getattr(creds, "WEBHOOK_KEY", None)
+    router = None
+    peers = getattr(creds, "WEBHOOK_PEERS", None)
+    if peers:
+        router = PeerRouter(
+            peers, creds.WEBHOOK_INSTANCE, secret, path,
+            ca_file=getattr(creds, "WEBHOOK_PEER_CA", None) or cert,
+        )
+    server = uvicorn.Server(uvicorn.Config(
+        build_web_app(app, secret, path, router),
+        host=getattr(creds, "WEBHOOK_HOST", "0.0.0.0"),
+        port=getattr(creds, "WEBHOOK_PORT", 8443),
+        ssl_certfile=cert,
+        ssl_keyfile=key,
+        use_colors=False,
+        log_level="warning",
+    ))
+
+    await app.initialize()
+    try:
+        if app.post_init:
+            await app.post_init(app)
+        base_url = getattr(creds, "WEBHOOK_URL", None)
+        if base_url:
+            certificate = open(cert, "rb") if cert else None
+            try:
+                await app.bot.set_webhook(
+                    url=f"{base_url.rstrip('/')}{path}",
+                    secret_token=secret,
+                    certificate=certificate,
+                    max_connections=getattr(creds, "WEBHOOK_MAX_CONNECTIONS", 40),
+                    allowed_updates=Update.ALL_TYPES,
+                )
+            finally:
+                if certificate is not None:
+                    certificate.close()
+            logger.info(f"[WEBHOOK] Registered {base_url.rstrip('/')}{path}")
+        await app.start()
+        try:
+            logger.info(f"[WEBHOOK] Listening on {server.config.host}:{server.config.port}{path}")
+            await server.serve()
+        finally:
+            if router is not None:
+                await router.close()
+            await app.stop()
+            if getattr(app, "post_stop", None):
+                await app.post_stop(app)
+    finally:
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+        await app.shutdown()
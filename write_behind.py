@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Collects non-critical DynamoDB puts and writes them in batches.
+
+    ``add`` only touches memory. A background task hands the buffered
+    items to ``writer`` (a blocking callable taking ``{table: [items]}``,
+    run through ``run``, e.g. ``AWSExecutor.run``) once ``flush_size``
+    items are waiting or every ``flush_interval`` seconds. A failed batch
+    is put back and retried on the next flush. At most ``max_items`` are
+    held; beyond that the oldest are dropped with a warning, so a DynamoDB
+    outage cannot grow memory without bound. Items are keyed, and a newer
+    put for the same key replaces the buffered one.
+    """
+
+    def __init__(self, writer, run, flush_size=25, flush_interval=5.0, max_items=10000):
+        self.writer = writer
+        self.run = run
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_items = max_items
+        self.written = 0
+        self.dropped = 0
+        self._items = OrderedDict()
+        self._wakeup = None
+        self._task = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, table, key, item):
+        """Buffer a put; must be called from the event loop."""
+        if self._closed:
+            raise RuntimeError("Write-behind buffer is closed")
+        self._ensure_started()
+        self._items.pop((table, key), None)
+        self._items[(table, key)] = item
+        self._enforce_cap()
+        if len(self._items) >= self.flush_size:
+            self._wakeup.set()
+
+    def _ensure_started(self):
+        # Started on first use so it runs on the application's event loop.
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    def _enforce_cap(self):
+        while len(self._items) > self.max_items:
+            (table, key), _ = self._items.popitem(last=False)
+            self.dropped += 1
+            logger.warning(f"[WRITE-BEHIND] Buffer full, dropped {table} {key}")
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._items:
+            return
+        pending, self._items = self._items, OrderedDict()
+        batches = {}
+        for (table, _), item in pending.items():
+            batches.setdefault(table, []).append(item)
+        try:
+            await self.run(self.writer, batches)
+            self.written += len(pending)
+        except asyncio.CancelledError:
+            # Puts are idempotent, so writing these again from close() is safe.
+            self._requeue(pending)
+            raise
+        except Exception as e:
+            logger.error(f"[WRITE-BEHIND] Flush of {len(pending)} items failed: {e}")
+            self._requeue(pending)
+
+    def _requeue(self, pending):
+        # Anything added meanwhile is newer, so it wins over the failed copy.
+        pending.update(self._items)
+        self._items = pending
+        self._enforce_cap()
+
+    async def close(self):
+        """Write out whatever is buffered, then log the written and dropped counts."""
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._items:
+            logger.error(f"[WRITE-BEHIND] {len(self._items)} items not written at shutdown")
+        if self.dropped:
+            logger.warning(f"[WRITE-BEHIND] {self.written} items written, {self.dropped} dropped while the buffer was full")
+        else:
+            logger.info(f"[WRITE-BEHIND] {self.written} items written")